@@ -4,8 +4,11 @@ import numpy as np
 import data as dt
 import sidebar as sb
 import services as sv
+import previsoes as pv
 import views as vw
+import metrics as mt
 import logging
+from config import ARQUIVO_METRICAS, HOST_METRICAS, PORTA_METRICAS
 
 # ----------------------------
 # CONFIGURAÇÕES INICIAIS
@@ -17,8 +20,6 @@ if "saved_analyses" not in st.session_state:
     st.session_state.saved_analyses = []
 if "dados_jogos" not in st.session_state:
     st.session_state.dados_jogos = None
-if "df_jogos" not in st.session_state:
-    st.session_state.df_jogos = pd.DataFrame()
 if "data_loaded_successfully" not in st.session_state:
     st.session_state.data_loaded_successfully = False
 
@@ -38,11 +39,29 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# Tempos por etapa desta execução (relatório opcional na sidebar)
+mt.iniciar_execucao()
+if PORTA_METRICAS:
+    mt.iniciar_servidor_metricas(int(PORTA_METRICAS), HOST_METRICAS)
+
+
+def encerrar_execucao():
+    """
+    Fecha o relatório de tempos da execução e o mostra se pedido. Chamada no
+    fim da página e antes de qualquer st.stop(), que pularia o fim do script.
+    """
+    mt.finalizar_execucao()
+    if ARQUIVO_METRICAS:
+        mt.exportar_prometheus(ARQUIVO_METRICAS)
+    if st.sidebar.toggle("⏱️ Mostrar tempos da execução", key="mostrar_tempos"):
+        vw.mostrar_relatorio_tempos(
+            mt.relatorio_execucao(), mt.caches_execucao(), mt.caches_processo())
+
+
 # Inicialização de estados
 for key, default in {
     "saved_analyses": [],
     "dados_jogos": None,
-    "df_jogos": pd.DataFrame(),
     "data_loaded_successfully": False
 }.items():
     if key not in st.session_state:
@@ -51,25 +70,91 @@ for key, default in {
 # ----------------------------
 # FUNÇÃO AUXILIAR → Value Bet
 # ----------------------------
-def mostrar_value_bet(label, prob, odd_justa, col):
+@mt.fragmento
+def mostrar_value_bet(label, prob, odd_justa):
     """
     Exibe probabilidade, odd justa e permite inserir odd do mercado para detectar valor.
+    Fragmento: mudar a odd reexecuta só este card.
+    """
+    odd_justa_safe = odd_justa if np.isfinite(odd_justa) else 1.0
+    st.metric(label=label, value=f"{prob}%", delta=f"Odd Justa: {odd_justa}")
+    odd_mercado = st.number_input(
+        f"Odd Mercado para {label}",
+        min_value=1.00,
+        value=float(odd_justa_safe),
+        step=0.01,
+        format="%.2f",
+        key=f"odd_mercado_{label}"
+    )
+    if odd_mercado > odd_justa:
+        valor_ev = (odd_mercado / odd_justa - 1) * 100
+        st.success(f"✅ Valor Encontrado: +{valor_ev:.2f}%")
+    else:
+        st.warning("Sem valor aparente.")
+
+
+# ----------------------------
+# SELETORES DE LINHA (fragmentos)
+# ----------------------------
+@mt.fragmento
+def card_linha_gols(linhas_gols: pd.DataFrame):
+    """Over/Under da linha de gols escolhida; trocar a linha reexecuta só este card."""
+    linha_gols = st.selectbox(
+        "Linha de Gols - Over/Under:",
+        [1.5, 2.5, 3.5],
+        index=1,
+        key="linha_gols"
+    )
+    over_under = linhas_gols.loc[linha_gols]
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown(f"- 🔼 Over {linha_gols}: **{over_under['p_over']}%**")
+    with col2:
+        st.markdown(f"- 🔽 Under {linha_gols}: **{over_under['p_under']}%**")
+
+
+@mt.fragmento
+def card_linha_escanteios(cantos: dict):
+    """Over/Under da linha de escanteios escolhida; trocar a linha reexecuta só este card."""
+    st.session_state.linha_escanteios = st.selectbox(
+        "Selecione a linha de escanteios:",
+        [6.5, 7.5, 8.5, 9.5, 10.5, 11.5],
+        index=3,
+        key="linha_escanteios_selecionada"
+    )
+    st.session_state.over_under_cantos = dt.calcular_over_under_cantos(
+        cantos, st.session_state.linha_escanteios)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown(
+            f"- Over {st.session_state.linha_escanteios}: **{st.session_state.over_under_cantos['p_over']}%**")
+    with col2:
+        st.markdown(
+            f"- Under {st.session_state.linha_escanteios}: **{st.session_state.over_under_cantos['p_under']}%**")
+
+
+# ----------------------------
+# ANÁLISE DA PARTIDA EM SESSÃO
+# ----------------------------
+def contexto_da_sessao(home, away, df, num_jogos, scenario, dia_iso):
+    """
+    contexto_partida guardado na sessão, pela versão da base, confronto,
+    janela, cenário e dia: as reexecuções com os mesmos filtros reaproveitam
+    o resultado sem passar pelos modelos nem pela cache.
     """
-    with col:
-        st.metric(label=label, value=f"{prob}%", delta=f"Odd Justa: {odd_justa}")
-        odd_mercado = st.number_input(
-            f"Odd Mercado para {label}",
-            min_value=1.00,
-            value=float(odd_justa),
-            step=0.01,
-            format="%.2f",
-            key=f"odd_mercado_{label}"
+    chave = (df.attrs.get("versao"), home, away, num_jogos, scenario, dia_iso)
+    analise = st.session_state.get("analise_partida")
+    if analise is None or analise["chave"] != chave:
+        contexto = dt.contexto_partida(
+            home, away, df,
+            num_jogos=num_jogos,
+            scenario=scenario,
+            as_of=dia_iso,
         )
-        if odd_mercado > odd_justa:
-            valor_ev = (odd_mercado / odd_justa - 1) * 100
-            st.success(f"✅ Valor Encontrado: +{valor_ev:.2f}%")
-        else:
-            st.warning("Sem valor aparente.")
+        analise = {"chave": chave, "contexto": contexto}
+        st.session_state.analise_partida = analise
+    return analise["contexto"]
 
 
 def odd_justa_from_pct(pct):
@@ -89,11 +174,18 @@ sb.sidebar()
 st.sidebar.markdown("### 🔎 Filtros da Análise")
 dia = sb.calendario()
 with st.spinner("⏳ Carregando dados do GitHub..."):
-    df_jogos, df_proximos_jogos, dia_br, dia_iso = sv.carregar_dados(dia)
+    df_proximos_jogos, dia_br, dia_iso = sv.carregar_dados(dia)
+    df_jogos = sv.carregar_base_historica()
+# Aquece em segundo plano as datas vizinhas para o próximo clique no calendário
+sv.prefetch_jogos(dia)
+# Previsões de todos os jogos do dia, calculadas uma vez por versão da base
+# numa thread do processo; até lá o filtro calcula pelo motor em lote
+pv.materializar_em_segundo_plano(dia_iso, df_proximos_jogos, df_jogos)
 
 st.session_state.df_proximos_jogos = df_proximos_jogos
-st.session_state.df_jogos = sv.carregar_base_historica()
-df, df_proximos = st.session_state.df_jogos, st.session_state.df_proximos_jogos
+# A base é a mesma para todas as sessões (somente leitura); a sessão guarda só a versão
+st.session_state.versao_base = df_jogos.attrs.get("versao")
+df, df_proximos = df_jogos, st.session_state.df_proximos_jogos
 
 vw.mostrar_status_carregamento(df_proximos_jogos, dia_br, dia_iso)
 vw.configurar_estilo_intervalo_jogos()
@@ -115,18 +207,7 @@ if not df_proximos.empty:
                                         "Geral", "Casa/Fora"], index=1, key="cenario_filtro")
 
         # --- DICIONÁRIO DE MERCADOS ---
-        mercados_disponiveis = {
-            "Vitória Casa (%)": "prob_home",
-            "Empate (%)": "prob_draw",
-            "Vitória Visitante (%)": "prob_away",
-            "Over 1.5 (%)": "over_1.5",
-            "Under 1.5 (%)": "under_1.5",
-            "Over 2.5 (%)": "over_2.5",
-            "Under 2.5 (%)": "under_2.5",
-            "BTTS Sim (%)": "btts_sim",
-            "BTTS Não (%)": "btts_nao",
-            "Gol no 1º Tempo (Over 0.5 HT) (%)": "gol_ht"
-        }
+        mercados_disponiveis = dt.MERCADOS_LOTE
         mercado_selecionado = st.selectbox(
             "Selecione o Mercado:", options=list(mercados_disponiveis.keys()))
         prob_minima = st.slider("Probabilidade Mínima (%)", 0, 100, 60, 5)
@@ -136,65 +217,32 @@ if not df_proximos.empty:
             if df_proximos.empty:
                 st.warning("Nenhum jogo carregado para a data selecionada.")
             else:
-                jogos_filtrados = []
-                total_jogos = len(df_proximos)
-                barra_progresso = st.progress(0, text="Analisando jogos...")
-
-                for index, jogo in df_proximos.iterrows():
-                    home_team, away_team = jogo['home'], jogo['away']
-
-                    # --- LÓGICA DE CÁLCULO OTIMIZADA ---
-                    # 1. Calcula os resultados base para golos FT (Poisson)
-                    resultados_gols = dt.prever_gols(
-                        home_team, away_team, df_jogos, num_jogos=num_jogos_filtro, scenario=cenario_filtro)
-
-                    if "erro" not in resultados_gols:
-                        # 2. Calcula todas as probabilidades necessárias a partir dos resultados base
-                        over_under_15 = dt.calcular_over_under(
-                            resultados_gols, linha=1.5)
-                        over_under_25 = dt.calcular_over_under(
-                            resultados_gols, linha=2.5)
-                        btts = dt.calcular_btts(resultados_gols)
-                        gol_ht_analise = dt.prever_gol_ht(
-                            home_team, away_team, df_jogos, num_jogos=num_jogos_filtro, scenario=cenario_filtro)
-
-                        # 3. Armazena todas as probabilidades num dicionário para fácil acesso
-                        probabilidades_jogo = {
-                            "prob_home": resultados_gols['p_home'] * 100,
-                            "prob_draw": resultados_gols['p_draw'] * 100,
-                            "prob_away": resultados_gols['p_away'] * 100,
-                            "over_1.5": over_under_15['p_over'],
-                            "under_1.5": over_under_15['p_under'],
-                            "over_2.5": over_under_25['p_over'],
-                            "under_2.5": over_under_25['p_under'],
-                            "btts_sim": btts['p_btts_sim'],
-                            "btts_nao": btts['p_btts_nao'],
-                            "gol_ht": gol_ht_analise['p_gol_ht']
-                        }
-
-                        # 4. Obtém a probabilidade do mercado selecionado e verifica a condição
-                        chave_mercado = mercados_disponiveis[mercado_selecionado]
-                        prob_atual = probabilidades_jogo[chave_mercado]
-
-                        if prob_atual >= prob_minima:
-                            odd_justa = round(100 / prob_atual,
-                                            2) if prob_atual > 0 else 0
-                            jogos_filtrados.append({
-                                "Hora": jogo['hora'], "Liga": jogo['liga'], "Home": home_team, "Away": away_team,
-                                "Confronto": f"{home_team} x {away_team}", "Mercado": mercado_selecionado,
-                                "Prob. (%)": round(prob_atual, 2), "Odd Justa": odd_justa
-                            })
-                    barra_progresso.progress(
-                        (index + 1) / total_jogos, text=f"Analisando: {home_team} x {away_team}")
-
-                # 1. Cria o DataFrame a partir da lista
-                df_resultados = pd.DataFrame(jogos_filtrados)
-
-                # 2. Verifica se o DataFrame não está vazio ANTES de ordenar
-                if not df_resultados.empty:
-                    df_resultados = df_resultados.sort_values(by="Prob. (%)", ascending=False)
-
-                # 3. Salva o DataFrame (ordenado ou vazio) no estado da sessão
+                # Jogos que atingem a probabilidade mínima no mercado escolhido,
+                # consultados na tabela de previsões do dia
+                chave_mercado = mercados_disponiveis[mercado_selecionado]
+                df_lote = pv.consultar_oportunidades(
+                    dia_iso, pv.chave_previsoes(df_proximos, df_jogos),
+                    num_jogos_filtro, cenario_filtro, chave_mercado, prob_minima)
+                if df_lote is None:
+                    # Ainda não materializado: calcula todos os jogos numa única passada
+                    with st.spinner("Analisando jogos..."):
+                        df_lote = dt.prever_jogos_em_lote(
+                            df_proximos, df_jogos, num_jogos=num_jogos_filtro, scenario=cenario_filtro,
+                            as_of=dia_iso)
+                    df_lote = dt.filtrar_oportunidades(df_lote, chave_mercado, prob_minima)
+                prob_atual = df_lote[chave_mercado]
+
+                # 1. Monta o DataFrame de resultados
+                df_resultados = pd.DataFrame({
+                    "Hora": df_lote['hora'], "Liga": df_lote['liga'],
+                    "Home": df_lote['home'], "Away": df_lote['away'],
+                    "Confronto": df_lote['home'] + " x " + df_lote['away'],
+                    "Mercado": mercado_selecionado,
+                    "Prob. (%)": prob_atual.round(2),
+                    "Odd Justa": np.where(prob_atual > 0, (100 / prob_atual).round(2), 0),
+                }).reset_index(drop=True)
+
+                # 2. Salva o DataFrame (ordenado ou vazio) no estado da sessão
                 st.session_state.resultados_filtro = df_resultados
 
         # Exibe os resultados interativos do filtro
@@ -248,17 +296,8 @@ if not df_proximos.empty:
             help="Geral: todos os jogos. Casa/Fora: só casa do mandante e fora do visitante."
         )
 
-        if selected_scenario == 'Geral':
-            df_home_base = df[(df['Home'].str.lower() == home_team.lower()) | (
-                df['Away'].str.lower() == home_team.lower())].copy()
-            df_away_base = df[(df['Home'].str.lower() == away_team.lower()) | (
-                df['Away'].str.lower() == away_team.lower())].copy()
-        else:
-            df_home_base = df[df['Home'].str.lower() == home_team.lower()].copy()
-            df_away_base = df[df['Away'].str.lower() == away_team.lower()].copy()
-
-        df_home_base, df_away_base = df_home_base.sort_values(
-            by='Data', ascending=False), df_away_base.sort_values(by='Data', ascending=False)
+        # Nomes como gravados na base (busca pelo código do time, sem diferenciar maiúsculas)
+        home_team, away_team = dt.nome_na_base(df, home_team), dt.nome_na_base(df, away_team)
 
         vw.home_away(home_team, away_team)
         st.markdown("### 📅 Intervalo de Jogos")
@@ -266,8 +305,11 @@ if not df_proximos.empty:
                             "Últimos 10 jogos"], index=1, horizontal=True, key="intervalo_jogos")
         num_jogos_selecionado = int(intervalo.split()[1])
 
-        df_home = df_home_base.head(num_jogos_selecionado)
-        df_away = df_away_base.head(num_jogos_selecionado)
+        # Janelas dos dois times filtradas uma vez; gols, HT e escanteios saem delas
+        contexto = contexto_da_sessao(
+            home_team, away_team, df_jogos, num_jogos_selecionado, selected_scenario, dia_iso)
+        # Últimos N jogos de cada time, do mais recente para o mais antigo
+        df_home, df_away = contexto.df_home.iloc[::-1], contexto.df_away.iloc[::-1]
         st.markdown("---")
 
         # ----------------------------
@@ -282,16 +324,12 @@ if not df_proximos.empty:
         # ----------------------------
         # ANÁLISE PRINCIPAL DO CENÁRIO
         # ----------------------------
-        analise = dt.analisar_cenario_partida(
-            home_team, away_team, df_jogos,
-            num_jogos=num_jogos_selecionado,
-            scenario=selected_scenario,
-            linha_gols=2.5
-        )
-        if "erro" in analise:
+        if contexto.erro:
             # Se sim, exibe o aviso e para a execução
-            st.warning(f"⚠️ {analise['erro']}")
+            st.warning(f"⚠️ {contexto.erro}")
+            encerrar_execucao()
             st.stop()
+        analise = contexto.cenario
 
         # Resultado 1X2
         st.markdown(f"#### 📊 Cenário da Partida ({analise['cenario_usado']})")
@@ -312,12 +350,9 @@ if not df_proximos.empty:
         # CARD DE VENCEDOR
         # ----------------------------
 
-        # Calcula previsões
-        resultados = dt.prever_gols(home_team, away_team, df_jogos,
-                                    num_jogos=num_jogos_selecionado,
-                                    min_jogos=3,
-                                    scenario=selected_scenario)
-        
+        # Previsões do modelo de gols
+        resultados = contexto.resultados
+
         # converte para %
         prob_home = round(resultados["p_home"] * 100, 2)
         prob_draw = round(resultados["p_draw"] * 100, 2)
@@ -362,11 +397,7 @@ if not df_proximos.empty:
         # Analise de gol HT
         st.markdown("## 🕐 Gol no 1º Tempo")
         # 🎯 Modelo probabilístico (Poisson)
-        ht = dt.prever_gol_ht(
-            home_team, away_team, df_jogos,
-            num_jogos=num_jogos_selecionado,
-            scenario=selected_scenario
-        )
+        ht = contexto.ht
         st.markdown(f"### Probabilidades com base no Modelo Poisson")
         col1, col2 = st.columns(2)
         with col1:
@@ -431,25 +462,15 @@ if not df_proximos.empty:
         # --- MERCADO DE GOLS ---
         st.markdown("## 🎯 Mercado de Gols (FT)")
 
-        # Probabilidades principais (Poisson)
-        st.sidebar.markdown(
-            "<h3 style='text-align: center;'>🎯 Linhas de Gols Over/Under</h3>", unsafe_allow_html=True)
-        linha_gols = st.sidebar.selectbox(
-            "Linha de Gols - Over/Under:",
-            [1.5, 2.5, 3.5],
-            index=1
-        )
-        over_under = dt.calcular_over_under(resultados, linha=linha_gols)
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown(f"- 🔼 Over {linha_gols}: **{over_under['p_over']}%**")
-        with col2:
-            st.markdown(f"- 🔽 Under {linha_gols}: **{over_under['p_under']}%**")
+        # Todas as linhas de gols calculadas de uma vez a partir da matriz de placares
+        linhas_gols = dt.mercados_over_under(
+            resultados["matriz"], [0.5, 1.5, 2.5, 3.5, 4.5]).set_index("linha")
+        card_linha_gols(linhas_gols)
 
         # --- Probabilidades por Mercado (Poisson) ---
-        linha_over15 = dt.calcular_over_under(resultados, linha=1.5)
-        linha_over25 = dt.calcular_over_under(resultados, linha=2.5)
-        linha_over35 = dt.calcular_over_under(resultados, linha=3.5)
+        linha_over15 = linhas_gols.loc[1.5]
+        linha_over25 = linhas_gols.loc[2.5]
+        linha_over35 = linhas_gols.loc[3.5]
         btts = dt.calcular_btts(resultados) if resultados else {
             "p_btts_sim": 0, "p_btts_nao": 0}
 
@@ -469,32 +490,11 @@ if not df_proximos.empty:
         st.subheader(
             "Probabilidades por Mercado com Poisson e Comparador de Valor")
 
+        # Cada card é um fragmento: mudar uma odd não reexecuta o app inteiro
         cols = st.columns(len(df_resultado_mercados))
-        for i, col in enumerate(cols):
+        for col, (_, mercado) in zip(cols, df_resultado_mercados.iterrows()):
             with col:
-                mercado = df_resultado_mercados.iloc[i]
-                odd_justa_safe = mercado['Odd Justa'] if np.isfinite(
-                    mercado['Odd Justa']) else 1.0
-                st.metric(
-                    label=mercado["Mercado"],
-                    value=f'{mercado["Probabilidade (%)"]}%',
-                    delta=f'Odd Justa: {mercado["Odd Justa"]}'
-                )
-
-                odd_mercado = st.number_input(
-                    f"Odd Mercado para {mercado['Mercado']}",
-                    min_value=1.00,
-                    value=odd_justa_safe,
-                    step=0.01,
-                    format="%.2f",
-                    key=f"odd_mercado_{mercado['Mercado']}"
-                )
-
-                if odd_mercado > mercado['Odd Justa']:
-                    valor_ev = (odd_mercado / mercado['Odd Justa'] - 1) * 100
-                    st.success(f"✅ Valor Encontrado: +{valor_ev:.2f}%")
-                else:
-                    st.warning("Sem valor aparente.")
+                mostrar_value_bet(mercado["Mercado"], mercado["Probabilidade (%)"], mercado["Odd Justa"])
 
         # Gráfico de barras para as probabilidades por mercado
         with st.expander("📊 Gráfico de Probabilidades por Mercado"):
@@ -506,35 +506,15 @@ if not df_proximos.empty:
         # 🎯 Modelo principal (NegBin)
         st.markdown("### Probabilidades (Modelo NegBin)")    
 
-        # Linhas Over/Under de Escanteios na sidebar
-        # A nova linha, com o texto centralizado
-        st.sidebar.markdown(
-            "<h3 style='text-align: center;'>📊 Linhas de Escanteios Over/Under</h3>", unsafe_allow_html=True)
-        linha_escanteios = st.sidebar.selectbox(
-            "Selecione a linha de escanteios:",
-            [6.5, 7.5, 8.5, 9.5, 10.5, 11.5],
-            index=3
-        )
-        st.session_state.linha_escanteios = linha_escanteios
-
         # Calcula probabilidades de escanteios
-        cantos = dt.prever_escanteios_nb(home_team, away_team, df_jogos,
-                                        num_jogos=num_jogos_selecionado, scenario=selected_scenario)
+        cantos = contexto.cantos
 
-        # Probabilidades Over/Under
-        st.session_state.over_under_cantos = dt.calcular_over_under_cantos(
-            cantos, st.session_state.linha_escanteios)
+        # Probabilidades Over/Under da linha escolhida
+        card_linha_escanteios(cantos)
 
         # Quem tem mais cantos
         mais_cantos = dt.prob_home_mais_cantos(cantos)
 
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown(
-                f"- Over {st.session_state.linha_escanteios}: **{st.session_state.over_under_cantos['p_over']}%**")
-        with col2:
-            st.markdown(
-                f"- Under {st.session_state.linha_escanteios}: **{st.session_state.over_under_cantos['p_under']}%**")
         col1, col2, col3 = st.columns(3)
         with col1:
             st.markdown(f"- 🏠 Home mais cantos: **{mais_cantos['home_mais']}%**")
@@ -545,7 +525,8 @@ if not df_proximos.empty:
 
         # 📊 Apoio: médias históricas
         resultado_escanteios = dt.estimar_linha_escanteios(
-            df_home, df_away, home_team, away_team)
+            df_home, df_away, home_team, away_team,
+            stats_home=contexto.stats_home, stats_away=contexto.stats_away)
         with st.expander("📋 Estatísticas Históricas de Escanteios"):
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -585,6 +566,11 @@ if not df_proximos.empty:
             vw.mostrar_tabela_jogos(df_home, home_team, "🏠")
             vw.mostrar_tabela_jogos(df_away, away_team, "✈️")
 
+        # Todas as janelas × cenários de uma vez (cache por confronto e dia)
+        grade = dt.grade_sensibilidade(home_team, away_team, df_jogos, as_of=dia_iso)
+        vw.mostrar_sensibilidade(grade, dt.estabilidade_mercados(grade),
+                                 num_jogos_selecionado, selected_scenario)
+
         # Botão para salvar análise atual
     if st.sidebar.button("💾 Salvar Análise Atual"):
         # 1. Extrai os dados dos mercados e escanteios
@@ -662,3 +648,8 @@ if not df_proximos.empty:
         # Expansor para ver as análises
         with st.sidebar.expander("Ver análises salvas"):
             st.dataframe(df_report)
+
+# ----------------------------
+# INSTRUMENTAÇÃO
+# ----------------------------
+encerrar_execucao()
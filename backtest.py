@@ -0,0 +1,216 @@
+"""
+Backtest walk-forward dos modelos sobre a base histórica.
+
+Exemplo:
+    python backtest.py --num-jogos 5 6 8 10 --scenario Geral Casa/Fora \
+        --inicio 2024-01-01 --output metricas.csv --calibracao calibracao.csv
+
+Reprocessa cada dia com jogos na base: prevê todos os jogos do dia só com
+os jogos anteriores (as_of), pelas janelas do índice de times, e compara
+com o resultado real. Mercados: 1X2, Over/Under de gols, BTTS, gol no HT
+(Over 0.5 HT) e Over/Under de escanteios. Métricas: log-loss, Brier e
+calibração por faixa de probabilidade.
+"""
+import argparse
+import sys
+from datetime import date
+import numpy as np
+import pandas as pd
+import metrics as mt
+
+# Sem o servidor do Streamlit (antes dos imports que criam as caches)
+mt.silenciar_avisos_streamlit()
+import data as dt
+import services as sv
+
+COLUNAS_RESULTADO = ["H_Gols_FT", "A_Gols_FT", "H_Gols_HT", "A_Gols_HT", "H_Escanteios", "A_Escanteios"]
+EPS = 1e-12
+# Jogos por chamada dos lotes (limita a memória das matrizes de placar/cantos)
+TAMANHO_BLOCO = 5000
+
+
+def _linhas_do_periodo(datas: np.ndarray, inicio=None, fim=None) -> np.ndarray:
+    """Posições dos jogos da base com data entre inicio e fim (inclusive)."""
+    primeira, ultima = 0, len(datas)
+    if inicio is not None:
+        primeira = np.searchsorted(datas, np.datetime64(pd.Timestamp(inicio).date(), "D"), side="left")
+    if fim is not None:
+        ultima = np.searchsorted(datas, np.datetime64(pd.Timestamp(fim).date(), "D"), side="right")
+    return np.arange(primeira, ultima)
+
+
+def prever_historico(df: pd.DataFrame, num_jogos: int = 6, scenario: str = "Casa/Fora",
+                     inicio=None, fim=None, min_jogos: int = 3,
+                     linhas_cantos=dt.LINHAS_CANTOS_LOTE) -> pd.DataFrame:
+    """
+    Previsões walk-forward de cada jogo da base entre inicio e fim: cada jogo
+    entra em prever_jogos_em_lote e prever_escanteios_em_lote com as_of na
+    própria data, então só vê os jogos de dias anteriores. Os jogos vão em
+    blocos de TAMANHO_BLOCO para limitar a memória das matrizes de placar.
+    Jogos sem histórico para os dois times ficam de fora.
+    Uma linha por jogo, com o resultado real.
+    """
+    indice = dt.indice_da_base(df)
+    if not indice["ordenada"]:
+        raise ValueError("O backtest exige a base ordenada por Data e sem datas inválidas.")
+    datas = indice["datas"]
+    home = df["Home"].astype(str).to_numpy()
+    away = df["Away"].astype(str).to_numpy()
+
+    partes = []
+    periodo = _linhas_do_periodo(datas, inicio, fim)
+    for i in range(0, len(periodo), TAMANHO_BLOCO):
+        linhas = periodo[i:i + TAMANHO_BLOCO]
+        jogos = pd.DataFrame({"linha": linhas, "Data": datas[linhas],
+                              "home": home[linhas], "away": away[linhas]})
+        gols = dt.prever_jogos_em_lote(jogos, df, num_jogos=num_jogos, scenario=scenario,
+                                       min_jogos=min_jogos, as_of=jogos["Data"])
+        cantos = dt.prever_escanteios_em_lote(jogos, df, num_jogos=num_jogos, scenario=scenario,
+                                              linhas=linhas_cantos, as_of=jogos["Data"])
+        # Os dois lotes mantêm os mesmos jogos (histórico para os dois times)
+        partes.append(pd.concat([gols, cantos.drop(columns=jogos.columns)], axis=1))
+
+    if not partes:
+        return pd.DataFrame()
+    previsoes = pd.concat(partes, ignore_index=True)
+    posicoes = previsoes["linha"].to_numpy()
+    for coluna in COLUNAS_RESULTADO:
+        previsoes[coluna] = df[coluna].to_numpy(dtype=float)[posicoes]
+    previsoes.insert(0, "scenario", scenario)
+    previsoes.insert(0, "num_jogos", num_jogos)
+    return previsoes
+
+
+def _eventos_binarios(previsoes: pd.DataFrame) -> dict:
+    """Mercado → (probabilidade prevista 0-1, aconteceu?) dos mercados de sim/não."""
+    total_ft = previsoes["H_Gols_FT"] + previsoes["A_Gols_FT"]
+    total_ht = previsoes["H_Gols_HT"] + previsoes["A_Gols_HT"]
+    total_cantos = previsoes["H_Escanteios"] + previsoes["A_Escanteios"]
+
+    eventos = {}
+    for linha in dt.LINHAS_GOLS_LOTE:
+        eventos[f"over_{linha}"] = (previsoes[f"over_{linha}"], total_ft > linha, total_ft)
+    eventos["btts_sim"] = (previsoes["btts_sim"],
+                           (previsoes["H_Gols_FT"] > 0) & (previsoes["A_Gols_FT"] > 0), total_ft)
+    eventos["gol_ht"] = (previsoes["gol_ht"], total_ht > 0, total_ht)
+    for coluna in previsoes.columns:
+        if coluna.startswith("over_cantos_"):
+            linha = float(coluna.rsplit("_", 1)[1])
+            eventos[coluna] = (previsoes[coluna], total_cantos > linha, total_cantos)
+
+    binarios = {}
+    for mercado, (prob, aconteceu, real) in eventos.items():
+        # Sem o resultado real (NaN) o jogo não entra na métrica daquele mercado
+        ok = (real.notna() & prob.notna()).to_numpy()
+        binarios[mercado] = (prob.to_numpy(dtype=float)[ok] / 100, aconteceu.to_numpy()[ok])
+    return binarios
+
+
+def _metricas_1x2(previsoes: pd.DataFrame) -> dict:
+    """Log-loss e Brier multiclasse do 1X2."""
+    colunas = ["H_Gols_FT", "A_Gols_FT", "prob_home", "prob_draw", "prob_away"]
+    ok = previsoes[colunas].notna().all(axis=1).to_numpy()
+    probs = previsoes[colunas[2:]].to_numpy(dtype=float)[ok] / 100
+    dif = (previsoes["H_Gols_FT"] - previsoes["A_Gols_FT"]).to_numpy()[ok]
+    real = np.column_stack([dif > 0, dif == 0, dif < 0]).astype(float)
+    return {
+        "mercado": "1x2",
+        "jogos": int(ok.sum()),
+        "log_loss": float(-np.log(np.clip((probs * real).sum(axis=1), EPS, 1)).mean()),
+        "brier": float(((probs - real) ** 2).sum(axis=1).mean()),
+        "prob_media": np.nan,
+        "frequencia_real": np.nan,
+    }
+
+
+def metricas(previsoes: pd.DataFrame) -> pd.DataFrame:
+    """Log-loss e Brier de cada mercado (uma linha por num_jogos, scenario e mercado)."""
+    linhas = []
+    for (num_jogos, scenario), grupo in previsoes.groupby(["num_jogos", "scenario"], sort=False):
+        base = {"num_jogos": num_jogos, "scenario": scenario}
+        linhas.append({**base, **_metricas_1x2(grupo)})
+        for mercado, (prob, aconteceu) in _eventos_binarios(grupo).items():
+            p = np.clip(prob, EPS, 1 - EPS)
+            linhas.append({
+                **base,
+                "mercado": mercado,
+                "jogos": len(prob),
+                "log_loss": float(-np.mean(np.where(aconteceu, np.log(p), np.log(1 - p)))),
+                "brier": float(np.mean((prob - aconteceu) ** 2)),
+                "prob_media": float(prob.mean()),
+                "frequencia_real": float(aconteceu.mean()),
+            })
+    return pd.DataFrame(linhas)
+
+
+def calibracao(previsoes: pd.DataFrame, faixas: int = 10) -> pd.DataFrame:
+    """
+    Calibração dos mercados de sim/não: jogos por faixa de probabilidade
+    prevista, com a probabilidade média da faixa e a frequência real.
+    """
+    limites = np.linspace(0, 1, faixas + 1)
+    partes = []
+    for (num_jogos, scenario), grupo in previsoes.groupby(["num_jogos", "scenario"], sort=False):
+        for mercado, (prob, aconteceu) in _eventos_binarios(grupo).items():
+            faixa = np.clip(np.searchsorted(limites, prob, side="right") - 1, 0, faixas - 1)
+            jogos = np.bincount(faixa, minlength=faixas)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                partes.append(pd.DataFrame({
+                    "num_jogos": num_jogos,
+                    "scenario": scenario,
+                    "mercado": mercado,
+                    "faixa_inicio": limites[:-1],
+                    "faixa_fim": limites[1:],
+                    "jogos": jogos,
+                    "prob_media": np.bincount(faixa, prob, minlength=faixas) / jogos,
+                    "frequencia_real": np.bincount(faixa, aconteceu, minlength=faixas) / jogos,
+                })[lambda d: d["jogos"] > 0])
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+
+def rodar(df: pd.DataFrame, num_jogos=(6,), cenarios=("Casa/Fora",), inicio=None, fim=None,
+          min_jogos: int = 3) -> pd.DataFrame:
+    """Previsões walk-forward de cada combinação de num_jogos × cenário."""
+    partes = [prever_historico(df, n, cenario, inicio, fim, min_jogos)
+              for n in num_jogos for cenario in cenarios]
+    partes = [p for p in partes if not p.empty]
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--num-jogos", type=int, nargs="+", default=[6],
+                        help="Tamanhos de janela (últimos N jogos). Padrão: 6.")
+    parser.add_argument("--scenario", nargs="+", choices=("Geral", "Casa/Fora"), default=["Casa/Fora"])
+    parser.add_argument("--inicio", type=date.fromisoformat, help="Primeiro dia avaliado (AAAA-MM-DD).")
+    parser.add_argument("--fim", type=date.fromisoformat, help="Último dia avaliado (AAAA-MM-DD).")
+    parser.add_argument("--min-jogos", type=int, default=3)
+    parser.add_argument("--faixas", type=int, default=10, help="Faixas da calibração.")
+    parser.add_argument("--output", help="Grava as métricas por mercado em CSV.")
+    parser.add_argument("--calibracao", help="Grava a tabela de calibração em CSV.")
+    parser.add_argument("--previsoes", help="Grava as previsões de cada jogo em CSV.")
+    args = parser.parse_args(argv)
+
+    df = sv.carregar_base_historica()
+    if df.empty:
+        print("Erro: base histórica indisponível.", file=sys.stderr)
+        return 1
+
+    previsoes = rodar(df, args.num_jogos, args.scenario, args.inicio, args.fim, args.min_jogos)
+    if previsoes.empty:
+        print("Nenhum jogo com histórico no período.", file=sys.stderr)
+        return 1
+
+    relatorio = metricas(previsoes)
+    print(relatorio.to_string(index=False, float_format=lambda v: f"{v:.4f}"), file=sys.stderr)
+    if args.output:
+        relatorio.to_csv(args.output, index=False)
+    if args.calibracao:
+        calibracao(previsoes, args.faixas).to_csv(args.calibracao, index=False)
+    if args.previsoes:
+        previsoes.to_csv(args.previsoes, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
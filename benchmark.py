@@ -0,0 +1,193 @@
+"""
+Benchmark da camada de modelos (data.py) com bases sintéticas.
+
+Exemplo:
+    python benchmark.py --temporadas 1 5 20 --ligas 20 --times 20 --output bench.csv
+
+Gera históricos no mesmo esquema de dados_redscore.csv (ligas com turno e
+returno por temporada), prepara a base pelo mesmo caminho do app
+(services._tipar_base + índice) e mede, para cada tamanho:
+  - tempo por chamada e throughput (jogos/s) das funções por jogo;
+  - tempo do scan completo do dia (prever_jogos_em_lote e pipeline por jogo);
+  - pico de memória (tracemalloc) de cada etapa.
+As funções com st.cache_data são chamadas sem a cache (__wrapped__).
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from datetime import date
+import numpy as np
+import pandas as pd
+import metrics as mt
+
+# Sem o servidor do Streamlit (antes dos imports que criam as caches)
+mt.silenciar_avisos_streamlit()
+import data as dt
+import parallel as par
+import services as sv
+
+INICIO_SINTETICO = date(2000, 1, 1)
+
+
+def gerar_historico(n_ligas: int = 8, times_por_liga: int = 20, temporadas: int = 1,
+                    seed: int = 0) -> pd.DataFrame:
+    """
+    Base sintética no esquema de dados_redscore.csv: cada liga joga turno e
+    returno por temporada (times_por_liga * (times_por_liga - 1) jogos),
+    com gols, escanteios, chutes e ataques sorteados por Poisson/NB.
+    """
+    rng = np.random.default_rng(seed)
+    casa, fora = np.nonzero(~np.eye(times_por_liga, dtype=bool))
+    jogos_liga = len(casa)
+    n = n_ligas * temporadas * jogos_liga
+
+    liga = np.repeat(np.arange(n_ligas), temporadas * jogos_liga)
+    temporada = np.tile(np.repeat(np.arange(temporadas), jogos_liga), n_ligas)
+    ordem = np.concatenate([rng.permutation(jogos_liga) for _ in range(n_ligas * temporadas)])
+    dias = temporada * 365 + (ordem * 300) // jogos_liga
+    datas = pd.to_datetime(INICIO_SINTETICO) + pd.to_timedelta(dias, unit="D")
+
+    # Força fixa por time para os gols terem estrutura (não só ruído)
+    forca = rng.gamma(8, 1 / 8, size=(n_ligas, times_por_liga))
+    idx_casa, idx_fora = casa[ordem], fora[ordem]
+    lam_casa = 1.45 * forca[liga, idx_casa] / forca[liga, idx_fora]
+    lam_fora = 1.15 * forca[liga, idx_fora] / forca[liga, idx_casa]
+    gols_ht_casa = rng.poisson(lam_casa * 0.45)
+    gols_ht_fora = rng.poisson(lam_fora * 0.45)
+
+    return pd.DataFrame({
+        "Liga": np.char.add("Liga ", liga.astype(str)),
+        "Data": datas.strftime("%Y-%m-%d"),
+        "Home": np.char.add(np.char.add("Time ", liga.astype(str)), np.char.add("-", idx_casa.astype(str))),
+        "Away": np.char.add(np.char.add("Time ", liga.astype(str)), np.char.add("-", idx_fora.astype(str))),
+        "H_Gols_FT": gols_ht_casa + rng.poisson(lam_casa * 0.55),
+        "A_Gols_FT": gols_ht_fora + rng.poisson(lam_fora * 0.55),
+        "H_Gols_HT": gols_ht_casa,
+        "A_Gols_HT": gols_ht_fora,
+        "H_Escanteios": rng.negative_binomial(6, 6 / (6 + 5.5), size=n),
+        "A_Escanteios": rng.negative_binomial(6, 6 / (6 + 4.5), size=n),
+        "H_Chute": rng.poisson(12, size=n),
+        "A_Chute": rng.poisson(10, size=n),
+        "H_Ataques": rng.poisson(100, size=n),
+        "A_Ataques": rng.poisson(90, size=n),
+    }).iloc[np.argsort(dias, kind="stable")].reset_index(drop=True)
+
+
+def gerar_jogos_do_dia(df: pd.DataFrame, n_jogos: int = 100, seed: int = 0) -> pd.DataFrame:
+    """Jogos do dia sintéticos (esquema de Jogos_do_Dia_RedScore) entre times da base."""
+    rng = np.random.default_rng(seed)
+    amostra = df.iloc[rng.choice(len(df), size=min(n_jogos, len(df)), replace=False)]
+    return pd.DataFrame({
+        "hora": [f"{10 + i % 12:02d}:00" for i in range(len(amostra))],
+        "liga": amostra["Liga"].to_numpy(),
+        "home": amostra["Home"].astype(str).to_numpy(),
+        "away": amostra["Away"].astype(str).to_numpy(),
+    }).assign(confronto=lambda d: d["home"] + " x " + d["away"])
+
+
+def preparar_base(df_bruto: pd.DataFrame, versao: str) -> pd.DataFrame:
+    """Mesmo preparo do carregamento no app: tipos, ordenação, versão e índice."""
+    df = sv._tipar_base(df_bruto.copy())
+    dt.versionar_base(df, versao)
+    dt.indice_da_base(df)
+    return df
+
+
+def medir(funcao, repeticoes: int = 1) -> dict:
+    """Tempo médio por execução (s) e pico de memória (MB) de uma execução."""
+    funcao()  # aquecimento (imports, caches de projeção...)
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    segundos = (time.perf_counter() - inicio) / repeticoes
+
+    tracemalloc.start()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"segundos": segundos, "pico_mb": pico / 2**20}
+
+
+def _etapas(df: pd.DataFrame, jogos: pd.DataFrame, num_jogos: int, scenario: str) -> dict:
+    """Etapas medidas: nome → (função sem argumentos, jogos processados por execução)."""
+    pares = list(zip(jogos["home"], jogos["away"]))
+    resultados = dt.prever_gols.__wrapped__(*pares[0], df, num_jogos=num_jogos, scenario=scenario)
+    cantos = dt.prever_escanteios_nb.__wrapped__(*pares[0], df, num_jogos=num_jogos, scenario=scenario)
+
+    def por_jogo(funcao, **kwargs):
+        return lambda: [funcao(h, a, df, num_jogos=num_jogos, scenario=scenario, **kwargs)
+                        for h, a in pares]
+
+    return {
+        "indexar_times": (lambda: dt.indexar_times(df), 0),
+        "calcular_forca_times (base inteira)": (lambda: dt.calcular_forca_times(df), 0),
+        "prever_gols": (por_jogo(dt.prever_gols.__wrapped__), len(pares)),
+        "prever_gol_ht": (por_jogo(dt.prever_gol_ht), len(pares)),
+        "prever_escanteios_nb": (por_jogo(dt.prever_escanteios_nb.__wrapped__), len(pares)),
+        "contexto_partida": (por_jogo(dt.contexto_partida.__wrapped__), len(pares)),
+        "mercados (OU/BTTS/cantos)": (lambda: [
+            (dt.mercados_over_under(resultados["matriz"]), dt.calcular_btts(resultados),
+             dt.calcular_over_under_cantos(cantos), dt.prob_home_mais_cantos(cantos))
+            for _ in pares], len(pares)),
+        "scan do dia (prever_jogos_em_lote)": (
+            lambda: dt.prever_jogos_em_lote(jogos, df, num_jogos=num_jogos, scenario=scenario),
+            len(pares)),
+        "scan do dia (pipeline por jogo)": (
+            lambda: par.analisar_jogos_do_dia(jogos, df, num_jogos=num_jogos, scenario=scenario,
+                                              workers=1),
+            len(pares)),
+    }
+
+
+def rodar(temporadas=(1, 5), n_ligas: int = 8, times_por_liga: int = 20, n_jogos_dia: int = 100,
+          num_jogos: int = 6, scenario: str = "Casa/Fora", repeticoes: int = 3,
+          seed: int = 0) -> pd.DataFrame:
+    """Roda todas as etapas para cada tamanho de base; uma linha por (tamanho, etapa)."""
+    linhas = []
+    for n_temporadas in temporadas:
+        df_bruto = gerar_historico(n_ligas, times_por_liga, n_temporadas, seed)
+        # Cada chamada tipa uma cópia nova, então o índice é sempre construído
+        preparo = medir(lambda: preparar_base(df_bruto, f"bench-{n_temporadas}"))
+        df = preparar_base(df_bruto, f"bench-{n_temporadas}")
+        jogos = gerar_jogos_do_dia(df_bruto, n_jogos_dia, seed)
+
+        etapas = {"preparar_base (tipos + índice)": (None, 0), **_etapas(df, jogos, num_jogos, scenario)}
+        for nome, (funcao, n_processados) in etapas.items():
+            medida = preparo if funcao is None else medir(funcao, repeticoes)
+            linhas.append({
+                "linhas_base": len(df),
+                "etapa": nome,
+                "ms": medida["segundos"] * 1e3,
+                "jogos_por_s": n_processados / medida["segundos"] if n_processados else np.nan,
+                "pico_mb": medida["pico_mb"],
+            })
+            print(f"{len(df):>10,} | {nome:<38} | {linhas[-1]['ms']:>10.2f} ms | "
+                  f"{linhas[-1]['jogos_por_s']:>10.0f} jogos/s | {medida['pico_mb']:>8.1f} MB",
+                  file=sys.stderr)
+    return pd.DataFrame(linhas)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--temporadas", type=int, nargs="+", default=[1, 5],
+                        help="Tamanhos da base, em temporadas por liga. Padrão: 1 5.")
+    parser.add_argument("--ligas", type=int, default=8)
+    parser.add_argument("--times", type=int, default=20, help="Times por liga.")
+    parser.add_argument("--jogos-dia", type=int, default=100, help="Jogos no scan do dia.")
+    parser.add_argument("--num-jogos", type=int, default=6)
+    parser.add_argument("--scenario", choices=("Geral", "Casa/Fora"), default="Casa/Fora")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Grava o relatório em CSV.")
+    args = parser.parse_args(argv)
+
+    relatorio = rodar(args.temporadas, args.ligas, args.times, args.jogos_dia,
+                      args.num_jogos, args.scenario, args.repeticoes, args.seed)
+    if args.output:
+        relatorio.to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
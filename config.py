@@ -1,2 +1,27 @@
+import os
+
 URL_DADOS = "https://raw.githubusercontent.com/rafa3lsilva/webscrapping_redscore/refs/heads/main/dados_redscore.csv"
 URL_BASE_JOGOS = "https://raw.githubusercontent.com/rafa3lsilva/webscrapping_redscore/refs/heads/main/jogos_do_dia"
+
+# Cache local da base histórica (Feather + metadados do upstream)
+DIR_CACHE = os.environ.get(
+    "REDSCORE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+# Dias anexados à base local ficam em arquivos de parte; acima deste número
+# de partes, tudo é compactado de volta num único Feather
+MAX_PARTES_BASE = 20
+# Intervalo mínimo (segundos) entre verificações da base no GitHub
+INTERVALO_VERIFICACAO_BASE = 300
+# Validade (segundos) dos jogos do dia em cache antes de um novo GET condicional
+INTERVALO_VERIFICACAO_JOGOS = 600
+# Timeout das requisições HTTP: (conexão, leitura) em segundos
+TIMEOUT_HTTP = (5, 30)
+# Prefetch dos jogos do dia: (dias antes, dias depois) da data escolhida
+JANELA_PREFETCH_JOGOS = (1, 3)
+WORKERS_PREFETCH_JOGOS = 4
+# Validade (segundos) do cache negativo de datas sem arquivo de jogos
+TTL_JOGOS_AUSENTES = 120
+# Métricas (formato Prometheus): arquivo de saída e/ou porta HTTP, opcionais
+ARQUIVO_METRICAS = os.environ.get("REDSCORE_METRICS_FILE")
+PORTA_METRICAS = os.environ.get("REDSCORE_METRICS_PORT")
+# Interface do /metrics: só local por padrão ("0.0.0.0" expõe em todas)
+HOST_METRICAS = os.environ.get("REDSCORE_METRICS_HOST", "127.0.0.1")
@@ -1,7 +1,18 @@
 import pandas as pd
 from scipy.stats import poisson, nbinom
 import numpy as np
-import streamlit as st
+import metrics as mt
+import weakref
+from dataclasses import dataclass
+from functools import lru_cache
+
+_VAZIO = np.empty(0, dtype=np.int64)
+
+# Índices já construídos, por objeto da base (ver indice_da_base)
+_INDICES = {}
+_MAX_INDICES = 4
+# Cortes de as_of com médias da liga guardadas por índice
+_MAX_MEDIAS_ATE = 64
 
 def drop_reset_index(df):
     df = df.dropna()
@@ -186,9 +197,13 @@ def probabilidade_poisson_over(media_esperada, linha_str):
         return 0.0
 
 # Função principal
-def estimar_linha_escanteios(df_home, df_away, home_team_name, away_team_name):
-    stats_home = calc_stats_team(df_home, home_team_name)
-    stats_away = calc_stats_team(df_away, away_team_name)
+def estimar_linha_escanteios(df_home, df_away, home_team_name, away_team_name,
+                             stats_home=None, stats_away=None):
+    # stats_home/stats_away: já calculadas (ex.: ContextoPartida, via estatisticas_janela)
+    if stats_home is None:
+        stats_home = calc_stats_team(df_home, home_team_name)
+    if stats_away is None:
+        stats_away = calc_stats_team(df_away, away_team_name)
 
     # 1. Calcula a média de escanteios esperada (lógica mantida)
     esc_home = (stats_home['esc_feitos_mean'] +
@@ -241,80 +256,716 @@ def analisar_consistencia_gols_ht(df: pd.DataFrame) -> float:
     return desvio_padrao_ht
 
 
-def calcular_forca_times(df: pd.DataFrame, min_jogos: int = 3):
+def _chave_time(nome) -> str:
+    """Forma normalizada do nome do time (espaços e maiúsculas ignorados)."""
+    return " ".join(str(nome).split()).lower()
+
+
+def _codigos_times(df: pd.DataFrame):
+    """Códigos inteiros de Home/Away num dicionário comum de nomes."""
+    home, away = df["Home"], df["Away"]
+    if (isinstance(home.dtype, pd.CategoricalDtype) and isinstance(away.dtype, pd.CategoricalDtype)
+            and home.cat.categories.equals(away.cat.categories)):
+        return home.cat.codes.to_numpy(), away.cat.codes.to_numpy(), home.cat.categories
+    codigos, nomes = pd.factorize(pd.concat([home, away], ignore_index=True))
+    return codigos[:len(df)], codigos[len(df):], pd.Index(nomes)
+
+
+def _plano_posicoes(codigos: np.ndarray, posicoes: np.ndarray, em_casa: np.ndarray,
+                    n_times: int, n_linhas: int) -> dict:
     """
-    Calcula força de ataque e defesa de cada time em relação à média da liga.
-    Se o time tiver menos que 'min_jogos', suas estatísticas são puxadas para a média.
+    Posições de todos os times numa única ordem plana (por código do time e,
+    dentro dele, cronológica), com o início de cada time em "limites" e a
+    chave crescente codigo * (n_linhas + 1) + posição, que acha o fim de
+    qualquer janela com uma busca binária. "acumulados", "jogos" e
+    "quadrados" guardam as somas acumuladas nessa ordem (ver _acumulado).
+    """
+    ordem = np.lexsort((posicoes, codigos))
+    codigos, posicoes = codigos[ordem], posicoes[ordem]
+    return {
+        "posicoes": posicoes,
+        "em_casa": em_casa[ordem],
+        "limites": np.searchsorted(codigos, np.arange(n_times + 1)),
+        "chaves": codigos.astype(np.int64) * (n_linhas + 1) + posicoes,
+        "acumulados": {},
+        "jogos": {},
+        "quadrados": {},
+    }
+
+
+def _agrupar_posicoes(plano: dict) -> list:
+    """Lista (por código de time) das posições em ordem crescente."""
+    posicoes, limites = plano["posicoes"], plano["limites"]
+    return [posicoes[limites[i]:limites[i + 1]] for i in range(len(limites) - 1)]
+
+
+# ----------------------------
+# MÉDIAS DA LIGA (globais e por liga)
+# ----------------------------
+COLUNAS_MEDIAS = [
+    "H_Gols_FT", "A_Gols_FT",
+    "H_Gols_HT", "A_Gols_HT",
+    "H_Escanteios", "A_Escanteios",
+    "H_Chute", "A_Chute",
+    "H_Ataques", "A_Ataques",
+]
+LIGA_GERAL = "Geral"
+
+
+def _coluna_liga(df: pd.DataFrame):
+    for coluna in ("Liga", "liga"):
+        if coluna in df.columns:
+            return coluna
+    return None
+
+
+def somas_estatisticas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Somas e contagens (valores não nulos) das colunas de COLUNAS_MEDIAS por
+    liga. Por serem aditivas, podem ser atualizadas só com os jogos novos.
+    """
+    coluna_liga = _coluna_liga(df)
+    ligas = df[coluna_liga].astype(str).to_numpy() if coluna_liga else np.full(len(df), LIGA_GERAL)
+    colunas = [c for c in COLUNAS_MEDIAS if c in df.columns]
+    grupos = df[colunas].astype(float).groupby(ligas)
+    return pd.concat([grupos.sum().add_prefix("soma_"), grupos.count().add_prefix("n_")], axis=1)
+
+
+def atualizar_somas_estatisticas(somas: pd.DataFrame, novos: pd.DataFrame,
+                                 removidos: pd.DataFrame = None) -> pd.DataFrame:
+    """Soma os jogos novos e desconta os removidos (ex.: duplicatas substituídas)."""
+    somas = somas.add(somas_estatisticas(novos), fill_value=0)
+    if removidos is not None and not removidos.empty:
+        somas = somas.sub(somas_estatisticas(removidos), fill_value=0)
+    return somas
+
+
+def medias_estatisticas(somas: pd.DataFrame) -> dict:
+    """Médias da liga a partir das somas: {"geral": Series, "ligas": DataFrame}."""
+    colunas = [c for c in COLUNAS_MEDIAS if f"soma_{c}" in somas.columns]
+    soma = somas[[f"soma_{c}" for c in colunas]].to_numpy()
+    n = somas[[f"n_{c}" for c in colunas]].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ligas = pd.DataFrame(soma / n, index=somas.index, columns=colunas)
+        geral = pd.Series(soma.sum(axis=0) / n.sum(axis=0), index=colunas)
+    return {"geral": geral, "ligas": ligas}
+
+
+def medias_da_base(df: pd.DataFrame, liga: str = None, as_of=None) -> pd.Series:
     """
-    media_gols_casa = df["H_Gols_FT"].mean()
-    media_gols_fora = df["A_Gols_FT"].mean()
+    Médias FT/HT de gols, escanteios, chutes e ataques da base (pré-calculadas
+    no índice). Com `liga`, usa a média daquela liga quando ela existir.
+    Com `as_of`, só os jogos anteriores à data entram na média.
+    """
+    indice = indice_da_base(df)
+    corte = _corte(df, as_of)
+    if corte >= len(df):
+        medias = indice["medias"]
+    else:
+        medias = indice["medias_ate"].get(corte)
+        if medias is None:
+            medias = medias_estatisticas(somas_estatisticas(df.iloc[:corte]))
+            if len(indice["medias_ate"]) >= _MAX_MEDIAS_ATE:
+                indice["medias_ate"].pop(next(iter(indice["medias_ate"])), None)
+            indice["medias_ate"][corte] = medias
+    if liga is not None and liga in medias["ligas"].index:
+        return medias["ligas"].loc[liga]
+    return medias["geral"]
+
+
+@mt.cronometrado()
+def indexar_times(df: pd.DataFrame, somas: pd.DataFrame = None) -> dict:
+    """
+    Índice código do time → posições (iloc) dos jogos em casa, fora e todos.
+    Como a base vem ordenada por Data, as posições já estão em ordem
+    cronológica e os últimos N jogos são as N últimas posições. As mesmas
+    posições ficam também numa ordem plana por lado (ver _plano_posicoes),
+    base das somas acumuladas por time.
+    Também guarda o dicionário nome ↔ código dos times, as datas dos jogos
+    (para os cortes por as_of) e as médias da liga (a partir de `somas`,
+    quando já vierem calculadas no carregamento).
+    """
+    cod_casa, cod_fora, nomes = _codigos_times(df)
+    if somas is None:
+        somas = somas_estatisticas(df)
+    n_times = len(nomes)
+    linhas = np.arange(len(df))
+    sim, nao = np.ones(len(df), dtype=bool), np.zeros(len(df), dtype=bool)
+    planos = {
+        "casa": _plano_posicoes(cod_casa, linhas, sim, n_times, len(df)),
+        "fora": _plano_posicoes(cod_fora, linhas, nao, n_times, len(df)),
+        "todos": _plano_posicoes(np.concatenate([cod_casa, cod_fora]), np.concatenate([linhas, linhas]),
+                                 np.concatenate([sim, nao]), n_times, len(df)),
+    }
 
-    ataque = {}
-    defesa = {}
+    ids = {}
+    for codigo, nome in enumerate(nomes):
+        ids.setdefault(_chave_time(nome), codigo)
 
-    times = pd.concat([df["Home"], df["Away"]]).unique()
+    datas = _datas_da_base(df)
+    ordenada = datas is not None and not np.isnat(datas).any() and bool((datas[1:] >= datas[:-1]).all())
 
-    for time in times:
-        jogos_casa = df[df["Home"] == time]
-        jogos_fora = df[df["Away"] == time]
+    return {
+        "nomes": nomes,
+        "ids": ids,
+        "cod_casa": cod_casa,
+        "cod_fora": cod_fora,
+        "casa": _agrupar_posicoes(planos["casa"]),
+        "fora": _agrupar_posicoes(planos["fora"]),
+        "todos": _agrupar_posicoes(planos["todos"]),
+        "planos": planos,
+        "datas": datas,
+        "ordenada": ordenada,
+        "medias": medias_estatisticas(somas),
+        # Médias da liga por corte de as_of, calculadas sob demanda
+        "medias_ate": {},
+        # Somas acumuladas (coluna -> (somas, contagens)) para _medias_gerais_ate
+        "acumulados": {},
+    }
 
-        n_casa = len(jogos_casa)
-        n_fora = len(jogos_fora)
 
-        # Ajuste: se poucos jogos, puxa para a média
-        ataque_casa = (jogos_casa["H_Gols_FT"].mean(
-        ) / media_gols_casa) if n_casa >= min_jogos else 1
-        defesa_casa = (jogos_casa["A_Gols_FT"].mean(
-        ) / media_gols_fora) if n_casa >= min_jogos else 1
+# Base de cada versão (ver versionar_base): versão -> o próprio DataFrame
+_BASES_VERSIONADAS = weakref.WeakValueDictionary()
+
+
+def versionar_base(df: pd.DataFrame, versao: str) -> pd.DataFrame:
+    """
+    Grava a versão em df.attrs e registra este objeto como a base dela.
+    Cópias e recortes herdam attrs, mas não o registro.
+    """
+    df.attrs["versao"] = versao
+    _BASES_VERSIONADAS[versao] = df
+    return df
+
+
+def _hash_base(df: pd.DataFrame):
+    """
+    Hash usado pelo st.cache_data para a base histórica: a versão gravada no
+    carregamento (versionar_base) + shape, em vez de varrer o DataFrame
+    inteiro a cada chamada. Sem versão, ou num recorte que só herdou a
+    versão em attrs, cai no hash do conteúdo.
+    """
+    versao = df.attrs.get("versao")
+    if versao and _BASES_VERSIONADAS.get(versao) is df:
+        return f"{versao}:{df.shape}"
+    return int(pd.util.hash_pandas_object(df, index=True).sum())
+
+
+# Funções cacheadas recebem a base inteira; o hash dela deve ser O(1)
+_HASH_FUNCS = {pd.DataFrame: _hash_base}
+
+
+def descartar_indice(df: pd.DataFrame):
+    """Libera já o índice de uma base que saiu de uso (ex.: a versão anterior)."""
+    _INDICES.pop(_chave_base(df), None)
+
+
+def _chave_base(df: pd.DataFrame):
+    # Identidade do objeto, não a versão: attrs (e a versão) passam para
+    # cópias e recortes, que teriam outro índice com a mesma chave
+    return id(df), df.shape
+
+
+def indice_da_base(df: pd.DataFrame, somas: pd.DataFrame = None) -> dict:
+    """
+    Retorna o índice de times da base, construído uma única vez por objeto
+    (a base carregada é a mesma para todas as sessões até a próxima versão).
+    O índice sai da memória junto com o DataFrame.
+    """
+    chave = _chave_base(df)
+    indice = _INDICES.get(chave)
+    if indice is None:
+        indice = indexar_times(df, somas)
+        if len(_INDICES) >= _MAX_INDICES:
+            _INDICES.pop(next(iter(_INDICES)), None)
+        _INDICES[chave] = indice
+        weakref.finalize(df, _INDICES.pop, chave, None)
+    return indice
+
+
+def id_time(df: pd.DataFrame, nome: str):
+    """Código do time na base (sem diferenciar maiúsculas/espaços) ou None."""
+    return indice_da_base(df)["ids"].get(_chave_time(nome))
+
+
+def nome_na_base(df: pd.DataFrame, nome: str) -> str:
+    """Nome do time como gravado na base; devolve o próprio nome se não existir."""
+    codigo = id_time(df, nome)
+    return nome if codigo is None else indice_da_base(df)["nomes"][codigo]
+
+
+def _datas_da_base(df: pd.DataFrame):
+    """Coluna Data como datetime64[D] (NaT onde a data for inválida), ou None."""
+    if "Data" not in df.columns:
+        return None
+    return pd.to_datetime(df["Data"], errors="coerce").to_numpy(dtype="datetime64[D]")
+
+
+def _corte(df: pd.DataFrame, as_of) -> int:
+    """
+    Quantos jogos da base são anteriores a `as_of` (busca binária nas datas
+    do índice). Os jogos da própria data ficam de fora, porque ainda não
+    tinham acontecido quando as previsões do dia foram feitas.
+    Sem as_of, a base inteira.
+    """
+    if as_of is None:
+        return len(df)
+    dia = np.datetime64(pd.Timestamp(as_of).date(), "D")
+    return int(np.searchsorted(_datas_ordenadas(df), dia, side="left"))
+
+
+def _datas_ordenadas(df: pd.DataFrame) -> np.ndarray:
+    indice = indice_da_base(df)
+    if not indice["ordenada"]:
+        raise ValueError("as_of exige a base ordenada por Data e sem datas inválidas.")
+    return indice["datas"]
+
+
+def _cortes(df: pd.DataFrame, as_of, n_jogos: int):
+    """
+    Corte (ver _corte) de cada jogo do dia: o mesmo para todos com uma única
+    data, ou um por jogo quando as_of traz uma data por jogo. None sem as_of.
+    """
+    if as_of is None:
+        return None
+    if np.ndim(as_of) == 0:
+        return np.full(n_jogos, _corte(df, as_of), dtype=np.int64)
+    dias = pd.to_datetime(np.asarray(as_of)).to_numpy(dtype="datetime64[D]")
+    return np.searchsorted(_datas_ordenadas(df), dias, side="left")
+
+
+def _medias_gerais_ate(df: pd.DataFrame, cortes: np.ndarray, coluna: str) -> np.ndarray:
+    """
+    Média geral de `coluna` nos jogos anteriores a cada corte, por somas
+    acumuladas guardadas no índice (uma subtração por jogo).
+    """
+    acumulados = indice_da_base(df)["acumulados"]
+    if coluna not in acumulados:
+        valores = df[coluna].to_numpy(dtype=float)
+        validos = ~np.isnan(valores)
+        acumulados[coluna] = (np.concatenate([[0.0], np.cumsum(np.where(validos, valores, 0))]),
+                              _somas_acumuladas(validos))
+    soma, n = acumulados[coluna]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return soma[cortes] / n[cortes]
+
+
+def _ultimos_jogos(df: pd.DataFrame, time: str, lado: str, num_jogos: int,
+                   corte: int = None) -> pd.DataFrame:
+    """
+    Últimos N jogos do time; lado: "casa", "fora" ou "todos".
+    Com `corte`, só entre as posições anteriores a ele (ver _corte).
+    """
+    codigo = id_time(df, time)
+    posicoes = _VAZIO if codigo is None else indice_da_base(df)[lado][codigo]
+    fim = len(posicoes) if corte is None else int(np.searchsorted(posicoes, corte))
+    return df.iloc[posicoes[max(fim - num_jogos, 0):fim]]
+
+
+def janelas_partida(df: pd.DataFrame, home: str, away: str, num_jogos: int, scenario: str,
+                    as_of=None):
+    """
+    Janelas de jogos do mandante e do visitante conforme o cenário.
+    as_of: considera só os jogos anteriores a essa data (padrão: base inteira).
+    """
+    corte = None if as_of is None else _corte(df, as_of)
+    if scenario == "Casa/Fora":
+        # Últimos N jogos em casa do mandante e fora do visitante
+        return (_ultimos_jogos(df, home, "casa", num_jogos, corte),
+                _ultimos_jogos(df, away, "fora", num_jogos, corte))
+    # Geral: últimos N jogos do time, independentemente do mando
+    return (_ultimos_jogos(df, home, "todos", num_jogos, corte),
+            _ultimos_jogos(df, away, "todos", num_jogos, corte))
+
+
+# ----------------------------
+# SOMAS ACUMULADAS POR TIME (estatísticas dos últimos N jogos em O(1))
+# ----------------------------
+def _limites_janelas(df: pd.DataFrame, lado: str, codigos, num_jogos: int, cortes=None):
+    """
+    Início e fim, na ordem plana de `lado`, da janela dos últimos N jogos de
+    cada time anteriores ao seu corte (ver _corte; sem cortes, a base
+    inteira). Aceita um código ou um array; códigos < 0 dão janela vazia.
+    """
+    plano = indice_da_base(df)["planos"][lado]
+    n = len(df)
+    codigos = np.asarray(codigos, dtype=np.int64)
+    cortes = n if cortes is None else np.asarray(cortes, dtype=np.int64)
+    existe = codigos >= 0
+    codigos = np.where(existe, codigos, 0)
+    fim = np.searchsorted(plano["chaves"], codigos * (n + 1) + cortes, side="left")
+    inicio = np.maximum(fim - num_jogos, plano["limites"][codigos])
+    return np.where(existe, inicio, 0), np.where(existe, fim, 0)
+
+
+def _somas_acumuladas(valores: np.ndarray) -> np.ndarray:
+    """
+    Soma acumulada com um zero à frente. Contagens e colunas inteiras ficam
+    em int32 quando o total cabe nele; colunas com nulos, em float64.
+    """
+    if valores.dtype.kind == "f":
+        return np.concatenate([[0.0], np.cumsum(valores)])
+    acumulado = np.concatenate([[0], np.cumsum(valores, dtype=np.int64)])
+    limites = np.iinfo(np.int32)
+    if acumulado.min() >= limites.min and acumulado.max() <= limites.max:
+        return acumulado.astype(np.int32)
+    return acumulado
+
+
+def _jogos_acumulados(plano: dict, mando: str = None) -> np.ndarray:
+    """Jogos acumulados na ordem plana (só os com `mando`, se dado); um por (lado, mando)."""
+    jogos = plano["jogos"].get(mando)
+    if jogos is None:
+        if mando is None:
+            jogos = np.arange(len(plano["posicoes"]) + 1, dtype=np.int32)
+        else:
+            jogos = _somas_acumuladas(plano["em_casa"] == (mando == "casa"))
+        plano["jogos"][mando] = jogos
+    return jogos
+
+
+def _valores_no_plano(df: pd.DataFrame, plano: dict, coluna: str, mando: str = None) -> tuple:
+    """
+    `coluna` na ordem plana, com 0 nos nulos e nos jogos fora de `mando`, e
+    a máscara dos valores válidos (None numa coluna inteira, que não tem
+    nulos: os válidos são os próprios jogos).
+    """
+    valores = df[coluna].to_numpy()[plano["posicoes"]]
+    jogos = None if mando is None else plano["em_casa"] == (mando == "casa")
+    if valores.dtype.kind in "iu":
+        return (valores if jogos is None else np.where(jogos, valores, 0)), None
+    valores = valores.astype(float)
+    validos = ~np.isnan(valores) if jogos is None else jogos & ~np.isnan(valores)
+    return np.where(validos, valores, 0.0), validos
+
+
+def _acumulado(df: pd.DataFrame, lado: str, coluna: str, mando: str = None) -> tuple:
+    """
+    Somas acumuladas, na ordem plana de `lado`, de `coluna`, dos valores
+    válidos (não nulos) e dos jogos. Com mando ("casa"/"fora"), só entram os
+    jogos em que o time tinha esse mando.
+    Construídas uma vez por (lado, coluna, mando) e guardadas no índice; os
+    jogos são os mesmos para todas as colunas, e numa coluna inteira também
+    servem de válidos.
+    """
+    plano = indice_da_base(df)["planos"][lado]
+    jogos = _jogos_acumulados(plano, mando)
+    acumulado = plano["acumulados"].get((coluna, mando))
+    if acumulado is None:
+        valores, validos = _valores_no_plano(df, plano, coluna, mando)
+        acumulado = (_somas_acumuladas(valores),
+                     jogos if validos is None else _somas_acumuladas(validos))
+        plano["acumulados"][(coluna, mando)] = acumulado
+    return (*acumulado, jogos)
+
+
+def _quadrados_acumulados(df: pd.DataFrame, lado: str, coluna: str, mando: str = None) -> np.ndarray:
+    """Somas acumuladas do quadrado de `coluna` (ver _acumulado), só para as variâncias."""
+    plano = indice_da_base(df)["planos"][lado]
+    quadrados = plano["quadrados"].get((coluna, mando))
+    if quadrados is None:
+        valores, _ = _valores_no_plano(df, plano, coluna, mando)
+        if valores.dtype.kind in "iu":
+            valores = valores.astype(np.int64)
+        quadrados = _somas_acumuladas(valores * valores)
+        plano["quadrados"][(coluna, mando)] = quadrados
+    return quadrados
+
+
+def _somas_janelas(df: pd.DataFrame, lado: str, codigos, num_jogos: int, coluna: str,
+                   mando: str = None, cortes=None, quadrados: bool = False) -> tuple:
+    """
+    (soma, soma dos quadrados, valores válidos, jogos) de `coluna` na janela
+    de cada time: duas subtrações nas somas acumuladas. A soma dos quadrados
+    só é calculada com quadrados=True (None sem ela).
+    """
+    inicio, fim = _limites_janelas(df, lado, codigos, num_jogos, cortes)
+    soma, validos, jogos = _acumulado(df, lado, coluna, mando)
+    soma_q = None
+    if quadrados:
+        acumulado_q = _quadrados_acumulados(df, lado, coluna, mando)
+        soma_q = acumulado_q[fim] - acumulado_q[inicio]
+    return soma[fim] - soma[inicio], soma_q, validos[fim] - validos[inicio], jogos[fim] - jogos[inicio]
+
+
+def _somas_mando(df: pd.DataFrame, lado: str, codigos, num_jogos: int, coluna: str,
+                 mando: str, cortes=None, quadrados: bool = False) -> tuple:
+    """Como _somas_janelas, só com os jogos da janela em que o time tinha `mando`."""
+    if lado == mando:
+        return _somas_janelas(df, lado, codigos, num_jogos, coluna, cortes=cortes, quadrados=quadrados)
+    if lado != "todos":
+        # Janela só de jogos fora (ou só em casa): nenhum jogo com o outro mando
+        zeros = np.zeros(np.shape(codigos))
+        return zeros, (zeros if quadrados else None), zeros, zeros
+    return _somas_janelas(df, lado, codigos, num_jogos, coluna, mando, cortes, quadrados)
+
+
+def _somas_do_time(df: pd.DataFrame, lado: str, codigos, num_jogos: int, estatistica: str,
+                   contra: bool = False, cortes=None, quadrados: bool = False) -> tuple:
+    """
+    Somas (ver _somas_janelas) de uma estatística do próprio time em cada
+    jogo da janela ("H_"/"A_" + estatistica conforme o mando) ou, com
+    contra=True, do adversário.
+    """
+    da_casa, de_fora = f"H_{estatistica}", f"A_{estatistica}"
+    if contra:
+        da_casa, de_fora = de_fora, da_casa
+    em_casa = _somas_mando(df, lado, codigos, num_jogos, da_casa, "casa", cortes, quadrados)
+    fora = _somas_mando(df, lado, codigos, num_jogos, de_fora, "fora", cortes, quadrados)
+    return tuple(None if c is None else c + f for c, f in zip(em_casa, fora))
+
+
+def _media_variancia(somas: tuple):
+    """
+    Média e variância amostral (ddof=1) a partir de (soma, soma dos
+    quadrados, n, ...); variância None sem a soma dos quadrados.
+    """
+    soma, soma_q, n = somas[:3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media = soma / n
+        if soma_q is None:
+            return media, None
+        variancia = np.maximum(soma_q - soma * media, 0) / (n - 1)
+    return media, variancia
+
+
+def estatisticas_janela(df: pd.DataFrame, time: str, lado: str = "todos", num_jogos: int = 6,
+                        as_of=None) -> dict:
+    """
+    Estatísticas do time nos últimos N jogos (lado: "casa", "fora" ou
+    "todos"), pelas somas acumuladas: as mesmas chaves de calc_stats_team
+    sobre a janela, sem filtrar o DataFrame.
+    """
+    codigo = id_time(df, time)
+    codigo = -1 if codigo is None else codigo
+    corte = None if as_of is None else _corte(df, as_of)
+    feitos = _somas_do_time(df, lado, codigo, num_jogos, "Escanteios", cortes=corte, quadrados=True)
+    sofridos = _somas_do_time(df, lado, codigo, num_jogos, "Escanteios", contra=True, cortes=corte)
+    media_feitos, variancia_feitos = _media_variancia(feitos)
+    return {
+        'esc_feitos_mean': float(media_feitos),
+        'esc_sofridos_mean': float(_media_variancia(sofridos)[0]),
+        'esc_feitos_std': float(np.sqrt(variancia_feitos)),
+        'finalizacoes_mean': float(_media_variancia(
+            _somas_do_time(df, lado, codigo, num_jogos, "Chute", cortes=corte))[0]),
+        'ataques_mean': float(_media_variancia(
+            _somas_do_time(df, lado, codigo, num_jogos, "Ataques", cortes=corte))[0]),
+    }
+
+
+# ----------------------------
+# PMFs VETORIZADAS (Poisson / Binomial Negativa)
+# ----------------------------
+def pmf_poisson(lam, k_max: int) -> np.ndarray:
+    """P(X = k) para k = 0..k_max numa única chamada; com um array de λ, uma linha por λ."""
+    k = np.arange(int(k_max) + 1)
+    return poisson.pmf(k, np.asarray(lam, dtype=float)[..., None])
+
+
+def pmf_nb_ou_poisson(mu, var, k_max: int, eps: float = 1e-9) -> np.ndarray:
+    """
+    PMF da Binomial Negativa ajustada por (mu, var) (ver _fit_nb_params);
+    Poisson sem overdispersão. Aceita arrays: uma linha por par (mu, var).
+    """
+    mu, var = np.asarray(mu, dtype=float), np.asarray(var, dtype=float)
+    k = np.arange(int(k_max) + 1)
+    nb = ~np.isnan(mu) & ~np.isnan(var) & (var > mu + eps)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.where(nb, mu * mu / (var - mu), 1.0)
+        p = np.where(nb, r / (r + mu), 0.5)
+    return np.where(nb[..., None], nbinom.pmf(k, r[..., None], p[..., None]), poisson.pmf(k, mu[..., None]))
+
 
-        ataque_fora = (jogos_fora["A_Gols_FT"].mean(
-        ) / media_gols_fora) if n_fora >= min_jogos else 1
-        defesa_fora = (jogos_fora["H_Gols_FT"].mean(
-        ) / media_gols_casa) if n_fora >= min_jogos else 1
+def _forcas(marcados, sofridos, n, media_marcados, media_sofridos, min_jogos: int = 3) -> tuple:
+    """
+    Forças de ataque e defesa num mando: médias de gols marcados e sofridos
+    em relação às médias da liga naquele mando (em casa: gols do mandante e
+    do visitante; fora, o inverso). Escalares ou arrays.
+    Com menos que 'min_jogos' jogos no mando, a força fica 1 (média).
+    Retorna (ataque, defesa).
+    """
+    ok = n >= min_jogos
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (np.where(ok, marcados / media_marcados, 1.0),
+                np.where(ok, sofridos / media_sofridos, 1.0))
 
-        ataque[time] = {"casa": ataque_casa, "fora": ataque_fora}
-        defesa[time] = {"casa": defesa_casa, "fora": defesa_fora}
 
-    return ataque, defesa, media_gols_casa, media_gols_fora
+@mt.cronometrado()
+def tabela_forcas(df: pd.DataFrame, min_jogos: int = 3, medias: pd.Series = None,
+                  as_of=None) -> pd.DataFrame:
+    """
+    Tabela de forças de ataque e defesa de todos os times de df, em relação
+    à média da liga, calculada numa única passada por mando.
+    Times com menos que 'min_jogos' jogos num mando ficam com força 1 (média).
+    medias: médias de referência (ex.: medias_da_base); sem elas, usa as médias de df.
+    as_of: só os jogos de df anteriores a essa data (df ordenado por Data).
+
+    Índice: nome do time. Colunas: n_casa, n_fora, ataque_casa, defesa_casa,
+    ataque_fora, defesa_fora. Atributos: media_gols_casa, media_gols_fora.
+    """
+    if as_of is not None:
+        df = df.iloc[:_corte(df, as_of)]
+    if medias is not None:
+        media_gols_casa, media_gols_fora = medias["H_Gols_FT"], medias["A_Gols_FT"]
+    else:
+        media_gols_casa = df["H_Gols_FT"].mean()
+        media_gols_fora = df["A_Gols_FT"].mean()
+
+    # Somas e contagens por código de time (bincount): sem o custo fixo do
+    # groupby do pandas, que domina nas janelas pequenas de prever_gols
+    cod_casa, cod_fora, nomes = _codigos_times(df)
+    n_times = len(nomes)
+    gols_casa = df["H_Gols_FT"].to_numpy(dtype=float)
+    gols_fora = df["A_Gols_FT"].to_numpy(dtype=float)
+
+    def contagem(codigos):
+        return np.bincount(codigos[codigos >= 0], minlength=n_times)
+
+    def media_por_time(codigos, valores):
+        validos = (codigos >= 0) & ~np.isnan(valores)
+        soma = np.bincount(codigos[validos], valores[validos], minlength=n_times)
+        return soma / np.bincount(codigos[validos], minlength=n_times)
+
+    n_casa, n_fora = contagem(cod_casa), contagem(cod_fora)
+    presentes = np.flatnonzero(n_casa + n_fora)
+    n_casa, n_fora = n_casa[presentes], n_fora[presentes]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ataque_casa, defesa_casa = _forcas(
+            media_por_time(cod_casa, gols_casa)[presentes], media_por_time(cod_casa, gols_fora)[presentes],
+            n_casa, media_gols_casa, media_gols_fora, min_jogos)
+        ataque_fora, defesa_fora = _forcas(
+            media_por_time(cod_fora, gols_fora)[presentes], media_por_time(cod_fora, gols_casa)[presentes],
+            n_fora, media_gols_fora, media_gols_casa, min_jogos)
+    tabela = pd.DataFrame({
+        "n_casa": n_casa,
+        "n_fora": n_fora,
+        "ataque_casa": ataque_casa,
+        "defesa_casa": defesa_casa,
+        "ataque_fora": ataque_fora,
+        "defesa_fora": defesa_fora,
+    }, index=pd.Index(nomes[presentes]))
+    tabela.attrs["media_gols_casa"] = media_gols_casa
+    tabela.attrs["media_gols_fora"] = media_gols_fora
+    return tabela
+
+
+def calcular_forca_times(df: pd.DataFrame, min_jogos: int = 3, medias: pd.Series = None,
+                         as_of=None):
+    """
+    Calcula força de ataque e defesa de cada time em relação à média da liga.
+    Se o time tiver menos que 'min_jogos', suas estatísticas são puxadas para a média.
+    medias: médias de referência (ex.: medias_da_base); sem elas, usa as médias de df.
+    Formato de dicionários sobre tabela_forcas, mantido para quem já o usa.
+    """
+    tabela = tabela_forcas(df, min_jogos=min_jogos, medias=medias, as_of=as_of)
+    ataque = {time: {"casa": linha.ataque_casa, "fora": linha.ataque_fora}
+              for time, linha in zip(tabela.index, tabela.itertuples())}
+    defesa = {time: {"casa": linha.defesa_casa, "fora": linha.defesa_fora}
+              for time, linha in zip(tabela.index, tabela.itertuples())}
+    return ataque, defesa, tabela.attrs["media_gols_casa"], tabela.attrs["media_gols_fora"]
 
 
-@st.cache_data
+@mt.cache_data(hash_funcs=_HASH_FUNCS)
 def prever_gols(home: str, away: str, df: pd.DataFrame, num_jogos: int = 6,
-                min_jogos: int = 3, max_gols: int = 5, scenario: str = "Casa/Fora"):
+                min_jogos: int = 3, max_gols: int = 5, scenario: str = "Casa/Fora",
+                as_of=None):
     """
     Previsão de gols com Poisson ajustada.
     scenario: "Geral" ou "Casa/Fora"
+    as_of: usa só os jogos anteriores a essa data (padrão: base inteira)
     """
+    home, away = nome_na_base(df, home), nome_na_base(df, away)
+    corte = None if as_of is None else _corte(df, as_of)
+    return _prever_gols_partida(df, home, away, num_jogos, scenario, min_jogos, max_gols, corte)
+
+
+def _codigo_ou_vazio(df: pd.DataFrame, nome: str) -> int:
+    codigo = id_time(df, nome)
+    return -1 if codigo is None else codigo
 
-    if scenario == "Casa/Fora":
-        # Últimos N jogos em casa do mandante
-        df_home = df[df["Home"] == home].tail(num_jogos)
-        # Últimos N jogos fora do visitante
-        df_away = df[df["Away"] == away].tail(num_jogos)
-    else:  # Geral
-        # Últimos N jogos do time, independentemente do mando
-        df_home = df[(df["Home"] == home) | (
-            df["Away"] == home)].tail(num_jogos)
-        df_away = df[(df["Home"] == away) | (
-            df["Away"] == away)].tail(num_jogos)
-
-    # Junta os jogos filtrados
-    df_filtrado = pd.concat([df_home, df_away])
-
-    # Forças ajustadas
-    ataque, defesa, media_gols_casa, media_gols_fora = calcular_forca_times(
-        df_filtrado, min_jogos=min_jogos)
-
-    lambda_home = ataque[home]["casa"] * defesa[away]["fora"] * media_gols_casa
-    lambda_away = ataque[away]["fora"] * defesa[home]["casa"] * media_gols_fora
-    
-    # λ esperados
-    lambda_home = ataque[home]["casa"] * defesa[away]["fora"] * media_gols_casa
-    lambda_away = ataque[away]["fora"] * defesa[home]["casa"] * media_gols_fora
+
+def _janela_matriz(df: pd.DataFrame, lado: str, inicio: np.ndarray, fim: np.ndarray) -> tuple:
+    """Posições (n, maior janela) de cada janela [inicio, fim) na ordem plana de `lado`, e a máscara."""
+    posicoes = indice_da_base(df)["planos"][lado]["posicoes"]
+    largura = int((fim - inicio).max()) if len(inicio) else 0
+    passos = inicio[:, None] + np.arange(largura)
+    mascara = passos < fim[:, None]
+    return posicoes[np.where(mascara, passos, 0)] if largura else passos, mascara
+
+
+def _lambdas_janelas(df: pd.DataFrame, cod_home, cod_away, num_jogos, scenario: str,
+                     min_jogos: int = 3, cortes=None) -> tuple:
+    """
+    λ FT do mandante e do visitante de cada jogo (arrays de códigos), com as
+    forças de _forcas sobre as duas janelas juntas: médias da liga e de cada
+    mando pelas somas acumuladas. Um confronto direto que está nas duas
+    janelas conta duas vezes, uma em cada janela.
+    num_jogos e cortes: um valor para todos ou um por jogo.
+    Retorna (lambda_home, lambda_away, jogos do mandante, jogos do visitante).
+    """
+    lado_home, lado_away = ("casa", "fora") if scenario == "Casa/Fora" else ("todos", "todos")
+    indice = indice_da_base(df)
+    cod_home, cod_away = np.asarray(cod_home, dtype=np.int64), np.asarray(cod_away, dtype=np.int64)
+    ini_h, fim_h = _limites_janelas(df, lado_home, cod_home, num_jogos, cortes)
+    ini_a, fim_a = _limites_janelas(df, lado_away, cod_away, num_jogos, cortes)
+
+    def somas(lado, codigo, coluna, mando=None):
+        if mando is None:
+            return _somas_janelas(df, lado, codigo, num_jogos, coluna, cortes=cortes)
+        return _somas_mando(df, lado, codigo, num_jogos, coluna, mando, cortes)
+
+    # Confrontos diretos: mandante em casa na janela do visitante e vice-versa
+    pos_h, m_h = _janela_matriz(df, lado_home, ini_h, fim_h)
+    pos_a, m_a = _janela_matriz(df, lado_away, ini_a, fim_a)
+    extra_casa = m_a & (indice["cod_casa"][pos_a] == cod_home[:, None])
+    extra_fora = m_h & (indice["cod_fora"][pos_h] == cod_away[:, None])
+
+    def media(somas_janela, posicoes, extra, coluna):
+        valores = df[coluna].to_numpy()[posicoes].astype(float)
+        validos = extra & ~np.isnan(valores)
+        soma = np.where(validos, valores, 0.0).sum(axis=1)
+        return (somas_janela[0] + soma) / (somas_janela[2] + validos.sum(axis=1))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Médias de gols em casa e fora nas duas janelas juntas
+        gh_h, gh_a = somas(lado_home, cod_home, "H_Gols_FT"), somas(lado_away, cod_away, "H_Gols_FT")
+        ga_h, ga_a = somas(lado_home, cod_home, "A_Gols_FT"), somas(lado_away, cod_away, "A_Gols_FT")
+        media_gols_casa = (gh_h[0] + gh_a[0]) / (gh_h[2] + gh_a[2])
+        media_gols_fora = (ga_h[0] + ga_a[0]) / (ga_h[2] + ga_a[2])
+
+        # Mandante jogando em casa / visitante jogando fora, nas duas janelas
+        casa_gh = somas(lado_home, cod_home, "H_Gols_FT", "casa")
+        casa_ga = somas(lado_home, cod_home, "A_Gols_FT", "casa")
+        fora_ga = somas(lado_away, cod_away, "A_Gols_FT", "fora")
+        fora_gh = somas(lado_away, cod_away, "H_Gols_FT", "fora")
+        ataque_home, defesa_home = _forcas(
+            media(casa_gh, pos_a, extra_casa, "H_Gols_FT"), media(casa_ga, pos_a, extra_casa, "A_Gols_FT"),
+            casa_gh[3] + extra_casa.sum(axis=1), media_gols_casa, media_gols_fora, min_jogos)
+        ataque_away, defesa_away = _forcas(
+            media(fora_ga, pos_h, extra_fora, "A_Gols_FT"), media(fora_gh, pos_h, extra_fora, "H_Gols_FT"),
+            fora_ga[3] + extra_fora.sum(axis=1), media_gols_fora, media_gols_casa, min_jogos)
+
+        lambda_home = ataque_home * defesa_away * media_gols_casa
+        lambda_away = ataque_away * defesa_home * media_gols_fora
+    return lambda_home, lambda_away, fim_h - ini_h, fim_a - ini_a
+
+
+def _prever_gols_partida(df: pd.DataFrame, home: str, away: str, num_jogos: int, scenario: str,
+                         min_jogos: int = 3, max_gols: int = 5, corte: int = None):
+    """Núcleo de prever_gols (nomes já como na base; corte como em _corte)."""
+    lambdas_home, lambdas_away, jogos_home, jogos_away = _lambdas_janelas(
+        df, [_codigo_ou_vazio(df, home)], [_codigo_ou_vazio(df, away)],
+        num_jogos, scenario, min_jogos, corte)
+    lambda_home, lambda_away = float(lambdas_home[0]), float(lambdas_away[0])
+    n_home, n_away = int(jogos_home[0]), int(jogos_away[0])
+    if not n_home or not n_away:
+        time = home if not n_home else away
+        return {"erro": f"Não há dados históricos suficientes para a equipa: {time}"}
 
     # Distribuições
-    probs_home = [poisson.pmf(i, lambda_home) for i in range(max_gols+1)]
-    probs_away = [poisson.pmf(i, lambda_away) for i in range(max_gols+1)]
+    probs_home = pmf_poisson(lambda_home, max_gols)
+    probs_away = pmf_poisson(lambda_away, max_gols)
 
     matriz = np.outer(probs_home, probs_away)
 
@@ -337,11 +988,70 @@ def prever_gols(home: str, away: str, df: pd.DataFrame, num_jogos: int = 6,
         "p_home": p_home,
         "p_draw": p_draw,
         "p_away": p_away,
-        "jogos_home_considerados": len(df_home),
-        "jogos_away_considerados": len(df_away),
+        "jogos_home_considerados": n_home,
+        "jogos_away_considerados": n_away,
     }
 
 
+# ----------------------------
+# AVALIAÇÃO DE MERCADOS A PARTIR DA MATRIZ DE PLACARES
+# ----------------------------
+@lru_cache(maxsize=32)
+def _projecao_total(k_home: int, k_away: int) -> np.ndarray:
+    """Matriz (k_home*k_away, k_home+k_away-1) que soma cada anti-diagonal (i + j = t)."""
+    i, j = np.indices((k_home, k_away))
+    projecao = np.zeros((k_home * k_away, k_home + k_away - 1))
+    projecao[np.arange(k_home * k_away), (i + j).ravel()] = 1.0
+    return projecao
+
+
+def distribuicao_total(matriz: np.ndarray) -> np.ndarray:
+    """
+    Distribuição do total (gols ou cantos) do jogo: P(total = t), t = 0..kh+ka-2.
+    Aceita uma matriz (k, k) ou um lote (n, k, k).
+    """
+    k_home, k_away = matriz.shape[-2:]
+    planas = matriz.reshape(*matriz.shape[:-2], k_home * k_away)
+    return planas @ _projecao_total(k_home, k_away)
+
+
+def probabilidades_over_under(matriz: np.ndarray, linhas) -> tuple:
+    """
+    P(Over) e P(Under) (0-1) de várias linhas de uma vez, pela distribuição
+    acumulada do total. Como no cálculo célula a célula, Under inclui total == linha.
+    Retorna arrays com shape (..., len(linhas)).
+    """
+    distribuicao = distribuicao_total(matriz)
+    acumulada = np.cumsum(distribuicao, axis=-1)
+    total = acumulada[..., -1:]
+
+    limites = np.floor(np.asarray(linhas, dtype=float)).astype(int)
+    p_under = acumulada[..., np.clip(limites, 0, acumulada.shape[-1] - 1)]
+    p_under = np.where(limites < 0, 0.0, p_under)
+    return total - p_under, p_under
+
+
+def mercados_over_under(matriz: np.ndarray, linhas=None) -> pd.DataFrame:
+    """
+    Tabela com Over/Under (%) de todas as linhas pedidas a partir de uma
+    única matriz. Sem linhas, usa 0.5, 1.5, ... até o total máximo da matriz.
+    """
+    if linhas is None:
+        linhas = np.arange(sum(matriz.shape) - 2) + 0.5
+    p_over, p_under = probabilidades_over_under(matriz, linhas)
+    return pd.DataFrame({
+        "linha": linhas,
+        "p_over": np.round(p_over * 100, 2),
+        "p_under": np.round(p_under * 100, 2),
+    })
+
+
+def _prob_btts(matriz: np.ndarray) -> np.ndarray:
+    """P(ambos marcam): total menos a linha 0 e a coluna 0 (0 x 0 contado uma vez)."""
+    sem_gol = matriz[..., 0, :].sum(axis=-1) + matriz[..., :, 0].sum(axis=-1) - matriz[..., 0, 0]
+    return matriz.sum(axis=(-2, -1)) - sem_gol
+
+
 def calcular_over_under(resultados: dict, linha: float = 2.5):
     """
     Calcula probabilidades de Over/Under X gols
@@ -350,24 +1060,12 @@ def calcular_over_under(resultados: dict, linha: float = 2.5):
     resultados: dict retornado por prever_gols
     linha: float, ex.: 2.5 ou 3.5
     """
-    matriz = resultados["matriz"]
-    max_gols = matriz.shape[0] - 1
-
-    p_over = 0
-    p_under = 0
-
-    for i in range(max_gols+1):   # gols home
-        for j in range(max_gols+1):  # gols away
-            total_gols = i + j
-            if total_gols > linha:
-                p_over += matriz[i, j]
-            else:
-                p_under += matriz[i, j]
+    p_over, p_under = probabilidades_over_under(resultados["matriz"], [linha])
 
     return {
         "linha": linha,
-        "p_over": round(p_over * 100, 2),
-        "p_under": round(p_under * 100, 2),
+        "p_over": round(float(p_over[0]) * 100, 2),
+        "p_under": round(float(p_under[0]) * 100, 2),
     }
 
 
@@ -379,17 +1077,8 @@ def calcular_btts(resultados: dict):
     resultados: dict retornado por prever_gols
     """
     matriz = resultados["matriz"]
-    max_gols = matriz.shape[0] - 1
-
-    p_btts_sim = 0
-    p_btts_nao = 0
-
-    for i in range(max_gols+1):   # gols home
-        for j in range(max_gols+1):  # gols away
-            if i > 0 and j > 0:
-                p_btts_sim += matriz[i, j]
-            else:
-                p_btts_nao += matriz[i, j]
+    p_btts_sim = float(_prob_btts(matriz))
+    p_btts_nao = float(matriz.sum()) - p_btts_sim
 
     return {
         "p_btts_sim": round(p_btts_sim * 100, 2),
@@ -397,7 +1086,7 @@ def calcular_btts(resultados: dict):
     }
 
 
-@st.cache_data
+@mt.cache_data(hash_funcs=_HASH_FUNCS)
 def analisar_cenario_partida(
     home: str,
     away: str,
@@ -406,7 +1095,8 @@ def analisar_cenario_partida(
     min_jogos: int = 3,
     max_gols: int = 5,
     scenario: str = "Casa/Fora",
-    linha_gols: float = 2.5
+    linha_gols: float = 2.5,
+    as_of=None,
 ):
     """
     Consolida a análise do cenário da partida:
@@ -415,14 +1105,13 @@ def analisar_cenario_partida(
     - BTTS
     - Placar mais provável
     - Cenário usado
+    as_of: usa só os jogos anteriores a essa data (padrão: base inteira)
     """
     # verifica se há dados históricos
-    times_historicos = pd.unique(df[['Home', 'Away']].values.ravel('K'))
-
-    if home not in times_historicos:
+    if id_time(df, home) is None:
         return {"erro": f"Não há dados históricos suficientes para a equipa: {home}"}
 
-    if away not in times_historicos:
+    if id_time(df, away) is None:
         return {"erro": f"Não há dados históricos suficientes para a equipa: {away}"}
    
     # --- Calcula a matriz de gols esperados
@@ -431,9 +1120,16 @@ def analisar_cenario_partida(
         num_jogos=num_jogos,
         min_jogos=min_jogos,
         max_gols=max_gols,
-        scenario=scenario
+        scenario=scenario,
+        as_of=as_of,
     )
+    if "erro" in resultados:
+        return resultados
+    return _cenario_de_resultados(resultados, scenario, linha_gols)
 
+
+def _cenario_de_resultados(resultados: dict, scenario: str, linha_gols: float = 2.5) -> dict:
+    """Núcleo de analisar_cenario_partida a partir do resultado de prever_gols."""
     matriz = resultados["matriz"]
 
     # --- 1. Probabilidades 1X2
@@ -473,34 +1169,30 @@ def analisar_cenario_partida(
     }
 
 
-def _stats_ht(df, time, min_jogos, liga_ht_home, liga_ht_away, scenario, num_jogos):
-    if scenario == "Casa/Fora":
-        # Apenas jogos em casa para o mandante
-        jogos_casa = df[df["Home"] == time].tail(num_jogos)
-        # Apenas jogos fora para o visitante
-        jogos_fora = df[df["Away"] == time].tail(num_jogos)
-    else:
-        # Todos os jogos, independente de casa/fora
-        jogos_casa = df[(df["Home"] == time) | (
-            df["Away"] == time)].tail(num_jogos)
-        jogos_fora = jogos_casa  # usa o mesmo conjunto
+def _medias_ht_janela(df: pd.DataFrame, lado: str, codigo, num_jogos: int, cortes=None) -> tuple:
+    """(média de H_Gols_HT, média de A_Gols_HT, jogos) na janela do time, pelas somas acumuladas."""
+    casa = _somas_janelas(df, lado, codigo, num_jogos, "H_Gols_HT", cortes=cortes)
+    fora = _somas_janelas(df, lado, codigo, num_jogos, "A_Gols_HT", cortes=cortes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return casa[0] / casa[2], fora[0] / fora[2], casa[3]
 
-    n_c, n_f = len(jogos_casa), len(jogos_fora)
 
-    # Ataque/defesa relativos no HT
-    atk_c = (jogos_casa["H_Gols_HT"].mean() /
-             liga_ht_home) if n_c >= min_jogos else 1.0
-    def_c = (jogos_casa["A_Gols_HT"].mean() /
-             liga_ht_away) if n_c >= min_jogos else 1.0
-    atk_f = (jogos_fora["A_Gols_HT"].mean() /
-             liga_ht_away) if n_f >= min_jogos else 1.0
-    def_f = (jogos_fora["H_Gols_HT"].mean() /
-             liga_ht_home) if n_f >= min_jogos else 1.0
+def _stats_ht(janela, min_jogos, liga_ht_home, liga_ht_away):
+    """
+    Forças HT de um time na sua janela (ver _medias_ht_janela). Em Casa/Fora
+    a janela do mandante só tem jogos em casa (e a do visitante só fora); no
+    Geral, a mesma janela serve para os dois lados.
+    """
+    media_h, media_a, n = janela
 
-    return {"atk_c": atk_c, "def_c": def_c, "atk_f": atk_f, "def_f": def_f}
+    # Ataque/defesa relativos no HT
+    atk_c, def_c = _forcas(media_h, media_a, n, liga_ht_home, liga_ht_away, min_jogos)
+    atk_f, def_f = _forcas(media_a, media_h, n, liga_ht_away, liga_ht_home, min_jogos)
 
+    return {"atk_c": float(atk_c), "def_c": float(def_c), "atk_f": float(atk_f), "def_f": float(def_f)}
 
 
+@mt.cronometrado()
 def prever_gol_ht(
     home: str,
     away: str,
@@ -509,33 +1201,42 @@ def prever_gol_ht(
     min_jogos: int = 3,
     scenario: str = "Casa/Fora",
     max_gols_ht: int = 3,
+    liga: str = None,
+    as_of=None,
 ):
     """
     Probabilidade de gol no 1º tempo:
       - P(>=1 gol no HT)  (Over 0.5 HT)
       - P(exatamente 1 gol no HT)
     Também retorna λ_home_ht e λ_away_ht e a matriz de gols HT (0..max_gols_ht).
+    liga: usa a média HT daquela liga como referência (padrão: média geral).
+    as_of: janelas e médias só com os jogos anteriores a essa data.
     """
 
-    # Filtra conforme cenário e últimos N
-    if scenario == "Casa/Fora":
-        df_home = df[df["Home"] == home].tail(num_jogos)
-        df_away = df[df["Away"] == away].tail(num_jogos)
-    else:
-        df_home = df[(df["Home"] == home) | (
-            df["Away"] == home)].tail(num_jogos)
-        df_away = df[(df["Home"] == away) | (
-            df["Away"] == away)].tail(num_jogos)
+    # Médias HT das janelas conforme cenário e últimos N
+    corte = None if as_of is None else _corte(df, as_of)
+    ht_home, ht_away = _janelas_ht(df, home, away, num_jogos, scenario, corte)
+    return _prever_gol_ht_medias(ht_home, ht_away, medias_da_base(df, liga, as_of),
+                                 min_jogos, scenario, max_gols_ht)
+
 
-    # Médias da liga no HT
-    liga_ht_home = df["H_Gols_HT"].mean()
-    liga_ht_away = df["A_Gols_HT"].mean()
+def _janelas_ht(df: pd.DataFrame, home: str, away: str, num_jogos: int, scenario: str,
+                corte: int = None) -> tuple:
+    lado_home, lado_away = ("casa", "fora") if scenario == "Casa/Fora" else ("todos", "todos")
+    return (_medias_ht_janela(df, lado_home, _codigo_ou_vazio(df, home), num_jogos, corte),
+            _medias_ht_janela(df, lado_away, _codigo_ou_vazio(df, away), num_jogos, corte))
+
+
+def _prever_gol_ht_medias(ht_home, ht_away, medias, min_jogos=3,
+                          scenario="Casa/Fora", max_gols_ht=3):
+    """Núcleo de prever_gol_ht a partir das médias HT das janelas (_medias_ht_janela)."""
+    # Médias da liga no HT (pré-calculadas no índice da base)
+    liga_ht_home = medias["H_Gols_HT"]
+    liga_ht_away = medias["A_Gols_HT"]
 
     # Forças relativas no HT com shrink
-    s_home = _stats_ht(df, home, min_jogos, liga_ht_home,
-                       liga_ht_away, scenario, num_jogos)
-    s_away = _stats_ht(df, away, min_jogos, liga_ht_home,
-                    liga_ht_away, scenario, num_jogos)
+    s_home = _stats_ht(ht_home, min_jogos, liga_ht_home, liga_ht_away)
+    s_away = _stats_ht(ht_away, min_jogos, liga_ht_home, liga_ht_away)
 
 
     # λ esperados no HT (mesma lógica do FT, mas com colunas de HT)
@@ -543,8 +1244,8 @@ def prever_gol_ht(
     lam_away_ht = s_away["atk_f"] * s_home["def_c"] * liga_ht_away
 
     # Distribuição conjunta HT (assumindo independência dos processos de gol no HT)
-    probs_h = [poisson.pmf(i, lam_home_ht) for i in range(max_gols_ht + 1)]
-    probs_a = [poisson.pmf(i, lam_away_ht) for i in range(max_gols_ht + 1)]
+    probs_h = pmf_poisson(lam_home_ht, max_gols_ht)
+    probs_a = pmf_poisson(lam_away_ht, max_gols_ht)
     matriz_ht = np.outer(probs_h, probs_a)
 
     # Probabilidades agregadas do total no HT
@@ -561,8 +1262,8 @@ def prever_gol_ht(
         # Exatamente 1 gol no HT
         "p_exato1_ht": round(p_exato1_ht * 100, 2),
         "matriz_ht": matriz_ht,
-        "jogos_home_considerados": len(df_home),
-        "jogos_away_considerados": len(df_away),
+        "jogos_home_considerados": int(ht_home[2]),
+        "jogos_away_considerados": int(ht_away[2]),
         "cenario_usado": scenario,
     }
 
@@ -580,14 +1281,10 @@ def _fit_nb_params(mu, var, eps=1e-9):
 
 
 def _pmf_nb_or_poisson(k_max, mu, var):
-    params = _fit_nb_params(mu, var)
-    if params is None:
-        return [poisson.pmf(k, mu) for k in range(k_max + 1)]
-    r, p = params
-    return [nbinom.pmf(k, r, p) for k in range(k_max + 1)]
+    return pmf_nb_ou_poisson(mu, var, k_max)
 
 
-@st.cache_data
+@mt.cache_data(hash_funcs=_HASH_FUNCS)
 def prever_escanteios_nb(
     home: str,
     away: str,
@@ -595,32 +1292,40 @@ def prever_escanteios_nb(
     num_jogos: int = 6,
     scenario: str = "Casa/Fora",
     max_cantos: int = 20,
+    as_of=None,
 ):
     """
     Modela escanteios com Negativo Binomial por time (fallback Poisson),
     e retorna matriz conjunta assumindo independência.
+    as_of: usa só os jogos anteriores a essa data (padrão: base inteira)
     """
+    corte = None if as_of is None else _corte(df, as_of)
+    cantos = _cantos_janelas(df, _codigo_ou_vazio(df, home), _codigo_ou_vazio(df, away),
+                             num_jogos, scenario, corte)
+    return _prever_escanteios_momentos(*cantos, scenario, max_cantos)
 
-    if scenario == "Casa/Fora":
-        h = df[df["Home"] == home].tail(num_jogos)
-        a = df[df["Away"] == away].tail(num_jogos)
-        mu_h = h["H_Escanteios"].mean()
-        var_h = h["H_Escanteios"].var(ddof=1)
-        mu_a = a["A_Escanteios"].mean()
-        var_a = a["A_Escanteios"].var(ddof=1)
-    else:
-        h_all = df[(df["Home"] == home) | (df["Away"] == home)].tail(num_jogos)
-        a_all = df[(df["Home"] == away) | (df["Away"] == away)].tail(num_jogos)
-        # médias do time considerando o lado em cada jogo
-        vals_h = np.where(h_all["Home"] == home,
-                          h_all["H_Escanteios"], h_all["A_Escanteios"])
-        vals_a = np.where(a_all["Away"] == away,
-                          a_all["A_Escanteios"], a_all["H_Escanteios"])
-        mu_h = np.mean(vals_h)
-        var_h = np.var(vals_h, ddof=1)
-        mu_a = np.mean(vals_a)
-        var_a = np.var(vals_a, ddof=1)
 
+def _cantos_janelas(df: pd.DataFrame, cod_home, cod_away, num_jogos: int, scenario: str,
+                    cortes=None) -> tuple:
+    """
+    Média, variância e jogos dos escanteios do próprio time na janela do
+    mandante e na do visitante (códigos únicos ou arrays), pelas somas
+    acumuladas: em Casa/Fora, os cantos em casa do mandante e fora do
+    visitante; no Geral, os cantos do time conforme o mando de cada jogo.
+    Retorna (mu_h, var_h, n_h, mu_a, var_a, n_a).
+    """
+    lado_home, lado_away = ("casa", "fora") if scenario == "Casa/Fora" else ("todos", "todos")
+    somas_h = _somas_do_time(df, lado_home, cod_home, num_jogos, "Escanteios",
+                             cortes=cortes, quadrados=True)
+    somas_a = _somas_do_time(df, lado_away, cod_away, num_jogos, "Escanteios",
+                             cortes=cortes, quadrados=True)
+    return (*_media_variancia(somas_h), somas_h[3], *_media_variancia(somas_a), somas_a[3])
+
+
+def _prever_escanteios_momentos(mu_h, var_h, n_h, mu_a, var_a, n_a,
+                                scenario="Casa/Fora", max_cantos=20):
+    """Núcleo de prever_escanteios_nb a partir da média/variância de cada janela."""
+    mu_h, var_h, mu_a, var_a = float(mu_h), float(var_h), float(mu_a), float(var_a)
     probs_h = _pmf_nb_or_poisson(max_cantos, mu_h, var_h)
     probs_a = _pmf_nb_or_poisson(max_cantos, mu_a, var_a)
     matriz = np.outer(probs_h, probs_a)  # P(H=k, A=j)
@@ -630,8 +1335,8 @@ def prever_escanteios_nb(
         "mu_away_cantos": mu_a,
         "matriz_cantos": matriz,
         "cenario_usado": scenario,
-        "jogos_home_considerados": len(h) if scenario == "Casa/Fora" else len(h_all),
-        "jogos_away_considerados": len(a) if scenario == "Casa/Fora" else len(a_all),
+        "jogos_home_considerados": int(n_h),
+        "jogos_away_considerados": int(n_a),
     }
 
 
@@ -639,19 +1344,9 @@ def calcular_over_under_cantos(resultados_cantos: dict, linha_total: float = 10.
     """
     Probabilidade de Over/Under X cantos (total do jogo), usando matriz conjunta.
     """
-    M = resultados_cantos["matriz_cantos"]
-    kmax_h, kmax_a = M.shape[0]-1, M.shape[1]-1
-
-    p_over = 0.0
-    p_under = 0.0
-    for i in range(kmax_h + 1):
-        for j in range(kmax_a + 1):
-            total = i + j
-            if total > linha_total:
-                p_over += M[i, j]
-            else:
-                p_under += M[i, j]
-    return {"linha": linha_total, "p_over": round(p_over * 100, 2), "p_under": round(p_under * 100, 2)}
+    p_over, p_under = probabilidades_over_under(resultados_cantos["matriz_cantos"], [linha_total])
+    return {"linha": linha_total, "p_over": round(float(p_over[0]) * 100, 2),
+            "p_under": round(float(p_under[0]) * 100, 2)}
 
 
 def prob_home_mais_cantos(resultados_cantos: dict):
@@ -667,3 +1362,307 @@ def prob_home_mais_cantos(resultados_cantos: dict):
         "empate": round(p_emp * 100, 2),
         "away_mais": round(p_away * 100, 2),
     }
+
+
+# ----------------------------
+# CONTEXTO DA PARTIDA (Análise Detalhada)
+# ----------------------------
+@dataclass
+class ContextoPartida:
+    """
+    Tudo o que a análise detalhada de um confronto precisa: as janelas dos
+    dois times (para exibição) e os modelos, calculados pelas somas
+    acumuladas das mesmas janelas.
+    df_home/df_away estão em ordem cronológica (o mais recente por último).
+    """
+    home: str
+    away: str
+    num_jogos: int
+    scenario: str
+    df_home: pd.DataFrame
+    df_away: pd.DataFrame
+    resultados: dict = None   # prever_gols
+    cenario: dict = None      # analisar_cenario_partida
+    ht: dict = None           # prever_gol_ht
+    cantos: dict = None       # prever_escanteios_nb
+    stats_home: dict = None   # estatisticas_janela (chaves de calc_stats_team)
+    stats_away: dict = None
+    erro: str = None
+
+
+@mt.cache_data(hash_funcs=_HASH_FUNCS)
+def contexto_partida(
+    home: str,
+    away: str,
+    df: pd.DataFrame,
+    num_jogos: int = 6,
+    scenario: str = "Casa/Fora",
+    min_jogos: int = 3,
+    max_gols: int = 5,
+    linha_gols: float = 2.5,
+    max_cantos: int = 20,
+    liga: str = None,
+    as_of=None,
+) -> ContextoPartida:
+    """
+    Monta o ContextoPartida: as janelas dos dois times e, das mesmas
+    janelas, o modelo de gols, o cenário (1X2, Over/Under, BTTS, placares),
+    o HT, os escanteios e as estatísticas de cada time, com os mesmos
+    resultados das funções individuais.
+    as_of: monta tudo só com os jogos anteriores a essa data.
+    """
+    home, away = nome_na_base(df, home), nome_na_base(df, away)
+    df_home, df_away = janelas_partida(df, home, away, num_jogos, scenario, as_of)
+    contexto = ContextoPartida(home, away, num_jogos, scenario, df_home, df_away)
+
+    corte = None if as_of is None else _corte(df, as_of)
+    resultados = _prever_gols_partida(df, home, away, num_jogos, scenario, min_jogos, max_gols, corte)
+    if "erro" in resultados:
+        contexto.erro = resultados["erro"]
+        return contexto
+
+    cod_home, cod_away = _codigo_ou_vazio(df, home), _codigo_ou_vazio(df, away)
+    lado_home, lado_away = ("casa", "fora") if scenario == "Casa/Fora" else ("todos", "todos")
+    contexto.resultados = resultados
+    contexto.cenario = _cenario_de_resultados(resultados, scenario, linha_gols)
+    contexto.ht = _prever_gol_ht_medias(*_janelas_ht(df, home, away, num_jogos, scenario, corte),
+                                        medias_da_base(df, liga, as_of), min_jogos, scenario)
+    contexto.cantos = _prever_escanteios_momentos(
+        *_cantos_janelas(df, cod_home, cod_away, num_jogos, scenario, corte), scenario, max_cantos)
+    contexto.stats_home = estatisticas_janela(df, home, lado_home, num_jogos, as_of)
+    contexto.stats_away = estatisticas_janela(df, away, lado_away, num_jogos, as_of)
+    return contexto
+
+
+# ----------------------------
+# PREVISÃO EM LOTE (Filtro de Oportunidades)
+# ----------------------------
+LINHAS_GOLS_LOTE = (1.5, 2.5, 3.5)
+
+# Mercados do filtro: rótulo exibido → coluna de prever_jogos_em_lote
+MERCADOS_LOTE = {
+    "Vitória Casa (%)": "prob_home",
+    "Empate (%)": "prob_draw",
+    "Vitória Visitante (%)": "prob_away",
+    "Over 1.5 (%)": "over_1.5",
+    "Under 1.5 (%)": "under_1.5",
+    "Over 2.5 (%)": "over_2.5",
+    "Under 2.5 (%)": "under_2.5",
+    "BTTS Sim (%)": "btts_sim",
+    "BTTS Não (%)": "btts_nao",
+    "Gol no 1º Tempo (Over 0.5 HT) (%)": "gol_ht",
+}
+
+
+@mt.cronometrado()
+def prever_jogos_em_lote(
+    fixtures_df: pd.DataFrame,
+    df: pd.DataFrame,
+    num_jogos: int = 6,
+    scenario: str = "Casa/Fora",
+    min_jogos: int = 3,
+    max_gols: int = 5,
+    as_of=None,
+) -> pd.DataFrame:
+    """
+    Mesmo modelo de prever_gols + prever_gol_ht para todos os jogos do dia
+    de uma vez: λ FT/HT, matrizes de placar (n_jogos, k, k) e as
+    probabilidades de cada mercado calculadas em arrays NumPy.
+
+    fixtures_df: jogos do dia (colunas home, away, ...)
+    num_jogos: tamanho da janela; aceita também um N por jogo
+    as_of: usa só os jogos anteriores a essa data (padrão: base inteira);
+           aceita também uma data por jogo (ex.: backtest de vários dias)
+    Retorna uma linha por jogo com histórico para os dois times, com as
+    colunas originais + prob_home, prob_draw, prob_away, over_X/under_X,
+    btts_sim, btts_nao e gol_ht (em %).
+    """
+    indice = indice_da_base(df)
+    ids_home = np.array([indice["ids"].get(_chave_time(t), -1) for t in fixtures_df["home"]], dtype=np.int64)
+    ids_away = np.array([indice["ids"].get(_chave_time(t), -1) for t in fixtures_df["away"]], dtype=np.int64)
+
+    cortes = _cortes(df, as_of, len(fixtures_df))
+    janelas = np.broadcast_to(np.asarray(num_jogos, dtype=np.int64), (len(fixtures_df),))
+    lado_home, lado_away = ("casa", "fora") if scenario == "Casa/Fora" else ("todos", "todos")
+
+    # --- FT: mesmas forças de prever_gols (janela do mandante + visitante)
+    lambda_home, lambda_away, n_home, n_away = _lambdas_janelas(
+        df, ids_home, ids_away, janelas, scenario, min_jogos, cortes)
+
+    validos = (n_home > 0) & (n_away > 0)
+    lambda_home, lambda_away = lambda_home[validos], lambda_away[validos]
+    n_home, n_away = n_home[validos], n_away[validos]
+    ids_home, ids_away = ids_home[validos], ids_away[validos]
+    resultado = fixtures_df[validos].reset_index(drop=True)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # --- HT: forças relativas às médias da liga no HT
+        if cortes is None:
+            medias = medias_da_base(df)
+            liga_ht_home, liga_ht_away = medias["H_Gols_HT"], medias["A_Gols_HT"]
+        else:
+            liga_ht_home = _medias_gerais_ate(df, cortes[validos], "H_Gols_HT")
+            liga_ht_away = _medias_gerais_ate(df, cortes[validos], "A_Gols_HT")
+        cortes_validos = None if cortes is None else cortes[validos]
+        ht_home_h, ht_home_a, n_h = _medias_ht_janela(df, lado_home, ids_home, janelas[validos], cortes_validos)
+        ht_away_h, ht_away_a, n_a = _medias_ht_janela(df, lado_away, ids_away, janelas[validos], cortes_validos)
+
+        atk_home_ht, def_home_ht = _forcas(ht_home_h, ht_home_a, n_h, liga_ht_home, liga_ht_away, min_jogos)
+        atk_away_ht, def_away_ht = _forcas(ht_away_a, ht_away_h, n_a, liga_ht_away, liga_ht_home, min_jogos)
+
+        lambda_home_ht = atk_home_ht * def_away_ht * liga_ht_home
+        lambda_away_ht = atk_away_ht * def_home_ht * liga_ht_away
+
+        # --- Matrizes de placar (n_jogos, k, k), normalizadas
+        gols = np.arange(max_gols + 1)
+        probs_home = poisson.pmf(gols[None, :], lambda_home[:, None])
+        probs_away = poisson.pmf(gols[None, :], lambda_away[:, None])
+        matrizes = probs_home[:, :, None] * probs_away[:, None, :]
+        soma = matrizes.sum(axis=(1, 2))
+        matrizes = np.where(soma[:, None, None] > 0, matrizes / soma[:, None, None], matrizes)
+
+    i, j = np.meshgrid(gols, gols, indexing="ij")
+    soma = matrizes.sum(axis=(1, 2))
+
+    resultado["lambda_home"] = lambda_home
+    resultado["lambda_away"] = lambda_away
+    resultado["prob_home"] = matrizes[:, i > j].sum(axis=1) * 100
+    resultado["prob_draw"] = matrizes[:, i == j].sum(axis=1) * 100
+    resultado["prob_away"] = matrizes[:, i < j].sum(axis=1) * 100
+    p_over, p_under = probabilidades_over_under(matrizes, LINHAS_GOLS_LOTE)
+    for k, linha in enumerate(LINHAS_GOLS_LOTE):
+        resultado[f"over_{linha}"] = np.round(p_over[:, k] * 100, 2)
+        resultado[f"under_{linha}"] = np.round(p_under[:, k] * 100, 2)
+    p_btts = _prob_btts(matrizes)
+    resultado["btts_sim"] = np.round(p_btts * 100, 2)
+    resultado["btts_nao"] = np.round((soma - p_btts) * 100, 2)
+    resultado["lambda_home_ht"] = lambda_home_ht
+    resultado["lambda_away_ht"] = lambda_away_ht
+    resultado["gol_ht"] = np.round((1 - np.exp(-(lambda_home_ht + lambda_away_ht))) * 100, 2)
+    resultado["jogos_home_considerados"] = n_home
+    resultado["jogos_away_considerados"] = n_away
+    return resultado
+
+
+LINHAS_CANTOS_LOTE = (8.5, 9.5, 10.5, 11.5)
+
+
+@mt.cronometrado()
+def prever_escanteios_em_lote(
+    fixtures_df: pd.DataFrame,
+    df: pd.DataFrame,
+    num_jogos: int = 6,
+    scenario: str = "Casa/Fora",
+    max_cantos: int = 20,
+    linhas=LINHAS_CANTOS_LOTE,
+    as_of=None,
+) -> pd.DataFrame:
+    """
+    Mesmo modelo de prever_escanteios_nb para todos os jogos do dia: média e
+    variância de cada janela pelas somas acumuladas e Over/Under de cada linha.
+    Mantém os mesmos jogos de prever_jogos_em_lote (histórico para os dois
+    times), com as colunas originais + mu_home_cantos, mu_away_cantos e
+    over_cantos_X/under_cantos_X (em %). num_jogos e as_of como em
+    prever_jogos_em_lote.
+    """
+    indice = indice_da_base(df)
+    ids_home = np.array([indice["ids"].get(_chave_time(t), -1) for t in fixtures_df["home"]], dtype=np.int64)
+    ids_away = np.array([indice["ids"].get(_chave_time(t), -1) for t in fixtures_df["away"]], dtype=np.int64)
+
+    mu_h, var_h, n_h, mu_a, var_a, n_a = _cantos_janelas(
+        df, ids_home, ids_away, num_jogos, scenario, _cortes(df, as_of, len(fixtures_df)))
+
+    validos = (n_h > 0) & (n_a > 0)
+    mu_h, var_h, mu_a, var_a = mu_h[validos], var_h[validos], mu_a[validos], var_a[validos]
+    resultado = fixtures_df[validos].reset_index(drop=True)
+
+    probs_h = pmf_nb_ou_poisson(mu_h, var_h, max_cantos)
+    probs_a = pmf_nb_ou_poisson(mu_a, var_a, max_cantos)
+    matrizes = probs_h[:, :, None] * probs_a[:, None, :]
+
+    resultado["mu_home_cantos"] = mu_h
+    resultado["mu_away_cantos"] = mu_a
+    p_over, p_under = probabilidades_over_under(matrizes, linhas)
+    for i, linha in enumerate(linhas):
+        resultado[f"over_cantos_{linha}"] = np.round(p_over[:, i] * 100, 2)
+        resultado[f"under_cantos_{linha}"] = np.round(p_under[:, i] * 100, 2)
+    return resultado
+
+
+def filtrar_oportunidades(df_lote: pd.DataFrame, coluna: str, prob_minima: float) -> pd.DataFrame:
+    """Jogos de prever_jogos_em_lote com `coluna` >= prob_minima, do mais provável ao menos."""
+    df_lote = df_lote[df_lote[coluna] >= prob_minima]
+    return df_lote.sort_values(by=coluna, ascending=False, kind="stable")
+
+
+# ----------------------------
+# SENSIBILIDADE (janelas × cenários)
+# ----------------------------
+JANELAS_SENSIBILIDADE = (5, 6, 8, 10)
+CENARIOS_SENSIBILIDADE = ("Geral", "Casa/Fora")
+
+# Colunas de probabilidade (%) da grade, na ordem de exibição
+MERCADOS_SENSIBILIDADE = (
+    ["prob_home", "prob_draw", "prob_away"]
+    + [f"{lado}_{linha}" for linha in LINHAS_GOLS_LOTE for lado in ("over", "under")]
+    + ["btts_sim", "btts_nao", "gol_ht"]
+    + [f"{lado}_cantos_{linha}" for linha in LINHAS_CANTOS_LOTE for lado in ("over", "under")]
+)
+
+
+@mt.cache_data(hash_funcs=_HASH_FUNCS)
+def grade_sensibilidade(
+    home: str,
+    away: str,
+    df: pd.DataFrame,
+    janelas=JANELAS_SENSIBILIDADE,
+    cenarios=CENARIOS_SENSIBILIDADE,
+    min_jogos: int = 3,
+    max_gols: int = 5,
+    max_cantos: int = 20,
+    as_of=None,
+) -> pd.DataFrame:
+    """
+    Todos os mercados da partida para cada janela × cenário de uma vez: o
+    confronto entra uma vez por janela nos lotes (num_jogos por linha), uma
+    chamada de cada lote por cenário.
+    Retorna uma linha por (scenario, num_jogos) com os λ, os jogos
+    considerados e as colunas de MERCADOS_SENSIBILIDADE (em %); janelas sem
+    histórico para os dois times ficam de fora.
+    """
+    jogos = pd.DataFrame({"home": home, "away": away,
+                          "num_jogos": np.asarray(janelas, dtype=np.int64)})
+    partes = []
+    for cenario in cenarios:
+        gols = prever_jogos_em_lote(jogos, df, num_jogos=jogos["num_jogos"].to_numpy(),
+                                    scenario=cenario, min_jogos=min_jogos, max_gols=max_gols,
+                                    as_of=as_of)
+        cantos = prever_escanteios_em_lote(jogos, df, num_jogos=jogos["num_jogos"].to_numpy(),
+                                           scenario=cenario, max_cantos=max_cantos, as_of=as_of)
+        # Os dois lotes mantêm as mesmas janelas (histórico para os dois times)
+        parte = pd.concat([gols, cantos.drop(columns=jogos.columns)], axis=1)
+        parte.insert(0, "scenario", cenario)
+        partes.append(parte.drop(columns=["home", "away"]))
+    if not partes:
+        return pd.DataFrame()
+    return pd.concat(partes, ignore_index=True)
+
+
+def estabilidade_mercados(grade: pd.DataFrame) -> pd.DataFrame:
+    """
+    Quanto cada mercado varia entre as janelas da grade_sensibilidade: por
+    cenário e mercado, mínimo, máximo, amplitude (pontos percentuais) e
+    desvio padrão das probabilidades. Do mais instável ao mais estável.
+    """
+    if grade.empty:
+        return pd.DataFrame()
+    mercados = [c for c in MERCADOS_SENSIBILIDADE if c in grade.columns]
+    longa = grade.melt(id_vars=["scenario", "num_jogos"], value_vars=mercados,
+                       var_name="mercado", value_name="prob")
+    tabela = (longa.groupby(["scenario", "mercado"], sort=False)["prob"]
+              .agg(minimo="min", maximo="max", desvio="std", janelas="count")
+              .reset_index())
+    tabela.insert(4, "amplitude", tabela["maximo"] - tabela["minimo"])
+    tabela["desvio"] = tabela["desvio"].fillna(0.0)
+    return tabela.sort_values(["scenario", "amplitude"], ascending=[True, False],
+                              kind="stable").reset_index(drop=True)
@@ -0,0 +1,241 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import streamlit as st
+from streamlit import config as st_config, logger as st_logger
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Limites (segundos) dos buckets dos histogramas no formato Prometheus
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+# Acumulado do processo: etapa -> {"n", "soma", "buckets"}
+_historicos = {}
+# Funções com cache: nome -> {"chamadas", "calculos"}
+_caches = {}
+# Etapas da execução (rerun) em andamento, por thread do script
+_execucao = threading.local()
+_servidor = None
+
+
+def iniciar_execucao():
+    """Começa um novo relatório de tempos para esta execução do script."""
+    _execucao.etapas = []
+    _execucao.caches = {}
+    _execucao.inicio = time.perf_counter()
+
+
+def finalizar_execucao(etapa: str = "execução do script"):
+    """Registra a duração total da execução (desde iniciar_execucao)."""
+    inicio = getattr(_execucao, "inicio", None)
+    if inicio is not None:
+        _registrar(etapa, time.perf_counter() - inicio)
+        _execucao.inicio = None
+
+
+def fragmento(funcao):
+    """
+    st.fragment com relatório de tempos: quando só o fragmento reexecuta
+    (o script não passa por iniciar_execucao), abre uma lista de etapas nova
+    em vez de somar às da execução anterior.
+    """
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        contexto = get_script_run_ctx(suppress_warning=True)
+        so_fragmento = bool(contexto and contexto.fragment_ids_this_run)
+        if so_fragmento:
+            iniciar_execucao()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            if so_fragmento:
+                finalizar_execucao("execução de fragmento")
+    return st.fragment(executar)
+
+
+def _registrar(etapa: str, segundos: float):
+    with _lock:
+        historico = _historicos.setdefault(etapa, {"n": 0, "soma": 0.0, "buckets": [0] * len(BUCKETS)})
+        historico["n"] += 1
+        historico["soma"] += segundos
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                historico["buckets"][i] += 1
+    etapas = getattr(_execucao, "etapas", None)
+    if etapas is not None:
+        etapas.append((etapa, segundos))
+
+
+def _contar_cache(nome: str, campo: str):
+    with _lock:
+        _caches.setdefault(nome, {"chamadas": 0, "calculos": 0})[campo] += 1
+    caches = getattr(_execucao, "caches", None)
+    if caches is not None:
+        caches.setdefault(nome, {"chamadas": 0, "calculos": 0})[campo] += 1
+
+
+@contextmanager
+def medir(etapa: str):
+    """Mede o bloco e registra o tempo em `etapa`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registrar(etapa, time.perf_counter() - inicio)
+
+
+def cronometrado(etapa: str = None):
+    """Decorator: mede cada chamada da função (etapa padrão: nome da função)."""
+    def decorar(funcao):
+        nome = etapa or funcao.__name__
+
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with medir(nome):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorar
+
+
+def cache_data(**opcoes):
+    """
+    st.cache_data com métricas: mede cada chamada (acerto ou não) e, à parte,
+    só as que de fato executam a função, para calcular a taxa de acerto.
+    `__wrapped__` continua apontando para a função original, sem cache.
+    """
+    def decorar(funcao):
+        nome = funcao.__name__
+
+        @functools.wraps(funcao)
+        def calcular(*args, **kwargs):
+            _contar_cache(nome, "calculos")
+            with medir(f"{nome} (cálculo)"):
+                return funcao(*args, **kwargs)
+
+        cacheada = st.cache_data(**opcoes)(calcular)
+
+        @functools.wraps(funcao)
+        def chamar(*args, **kwargs):
+            _contar_cache(nome, "chamadas")
+            with medir(nome):
+                return cacheada(*args, **kwargs)
+
+        chamar.clear = cacheada.clear
+        return chamar
+    return decorar
+
+
+def silenciar_avisos_streamlit():
+    """
+    Para os scripts de linha de comando (CLI, backtest, benchmark): sem o
+    servidor do Streamlit, as funções em cache e os st.* avisam "No runtime
+    found", "missing ScriptRunContext" e "streamlit run ..." a cada chamada.
+    Desliga o aviso de execução direta e deixa só erros nos loggers do
+    Streamlit (inclusive nos criados depois).
+    """
+    st_config.set_option("global.showWarningOnDirectExecution", False)
+    st_config.set_option("logger.level", "error")
+    st_logger.set_log_level("error")
+
+
+def _tabela_caches(caches: dict) -> pd.DataFrame:
+    linhas = []
+    for nome, c in sorted(caches.items()):
+        acertos = max(c["chamadas"] - c["calculos"], 0)
+        linhas.append({
+            "função": nome, "chamadas": c["chamadas"], "acertos": acertos,
+            "falhas": c["calculos"],
+            "taxa de acerto (%)": round(100 * acertos / c["chamadas"], 1) if c["chamadas"] else None,
+        })
+    return pd.DataFrame(linhas, columns=["função", "chamadas", "acertos", "falhas", "taxa de acerto (%)"])
+
+
+def relatorio_execucao() -> pd.DataFrame:
+    """Tempos da execução atual por etapa (chamadas, total e máximo em ms)."""
+    etapas = pd.DataFrame(getattr(_execucao, "etapas", []), columns=["etapa", "segundos"])
+    if etapas.empty:
+        return pd.DataFrame(columns=["etapa", "chamadas", "total_ms", "max_ms"])
+    relatorio = etapas.groupby("etapa", sort=False)["segundos"].agg(["count", "sum", "max"])
+    relatorio.columns = ["chamadas", "total_ms", "max_ms"]
+    relatorio[["total_ms", "max_ms"]] = (relatorio[["total_ms", "max_ms"]] * 1e3).round(2)
+    return relatorio.sort_values("total_ms", ascending=False).reset_index()
+
+
+def caches_execucao() -> pd.DataFrame:
+    """Acertos/falhas de cada função com st.cache_data nesta execução."""
+    return _tabela_caches(getattr(_execucao, "caches", {}))
+
+
+def caches_processo() -> pd.DataFrame:
+    """Acertos/falhas acumulados desde o início do processo."""
+    with _lock:
+        return _tabela_caches({k: dict(v) for k, v in _caches.items()})
+
+
+def _rotulo(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def texto_prometheus() -> str:
+    """Métricas acumuladas no formato de texto do Prometheus."""
+    with _lock:
+        historicos = {k: {**v, "buckets": list(v["buckets"])} for k, v in _historicos.items()}
+        caches = {k: dict(v) for k, v in _caches.items()}
+
+    linhas = ["# HELP redscore_etapa_segundos Duração das etapas do app.",
+              "# TYPE redscore_etapa_segundos histogram"]
+    for etapa, h in sorted(historicos.items()):
+        rotulo = f'etapa="{_rotulo(etapa)}"'
+        for limite, n in zip(BUCKETS, h["buckets"]):
+            linhas.append(f'redscore_etapa_segundos_bucket{{{rotulo},le="{limite}"}} {n}')
+        linhas.append(f'redscore_etapa_segundos_bucket{{{rotulo},le="+Inf"}} {h["n"]}')
+        linhas.append(f"redscore_etapa_segundos_sum{{{rotulo}}} {h['soma']:.6f}")
+        linhas.append(f"redscore_etapa_segundos_count{{{rotulo}}} {h['n']}")
+
+    linhas += ["# HELP redscore_cache_chamadas_total Chamadas de funções com st.cache_data.",
+               "# TYPE redscore_cache_chamadas_total counter"]
+    linhas += [f'redscore_cache_chamadas_total{{funcao="{_rotulo(n)}"}} {c["chamadas"]}'
+               for n, c in sorted(caches.items())]
+    linhas += ["# HELP redscore_cache_falhas_total Chamadas que não acharam resultado em cache.",
+               "# TYPE redscore_cache_falhas_total counter"]
+    linhas += [f'redscore_cache_falhas_total{{funcao="{_rotulo(n)}"}} {c["calculos"]}'
+               for n, c in sorted(caches.items())]
+    return "\n".join(linhas) + "\n"
+
+
+def exportar_prometheus(caminho: str):
+    """Grava as métricas num arquivo (ex.: para o textfile collector do node_exporter)."""
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(texto_prometheus())
+    os.replace(tmp, caminho)
+
+
+class _HandlerMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        corpo = texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor_metricas(porta: int, host: str = "127.0.0.1"):
+    """
+    Expõe /metrics (qualquer caminho) em segundo plano, por padrão só na
+    interface local; chamadas repetidas são ignoradas.
+    """
+    global _servidor
+    with _lock:
+        if _servidor is not None:
+            return
+        _servidor = ThreadingHTTPServer((host, porta), _HandlerMetricas)
+    threading.Thread(target=_servidor.serve_forever, daemon=True, name="metricas").start()
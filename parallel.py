@@ -0,0 +1,111 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from streamlit import runtime
+import data as dt
+
+# Abaixo disso a análise roda em série (criar processos custa mais que ganha)
+MIN_JOGOS_PARALELO = 40
+
+# Base histórica visível para os processos filhos. É definida antes do fork,
+# então os workers herdam os arrays (copy-on-write) em vez de recebê-los
+# serializados a cada tarefa. O fork só é seguro num processo sem outras
+# threads: o executor é para a CLI (redscore scan --workers) e o benchmark,
+# não para o servidor do Streamlit.
+_BASE = None
+_lock_base = threading.Lock()
+
+
+def analisar_jogo(home: str, away: str, df: pd.DataFrame, num_jogos: int = 6,
+                  scenario: str = "Casa/Fora", as_of=None):
+    """
+    Pipeline de um jogo (prever_gols + mercados + prever_gol_ht), com as
+    mesmas chaves de prever_jogos_em_lote. Retorna None sem histórico.
+    """
+    # Chama as funções sem o st.cache_data: aqui não há sessão para reaproveitar
+    resultados = dt.prever_gols.__wrapped__(
+        home, away, df, num_jogos=num_jogos, scenario=scenario, as_of=as_of)
+    if "erro" in resultados:
+        return None
+
+    linha = {
+        "lambda_home": resultados["lambda_home"],
+        "lambda_away": resultados["lambda_away"],
+        "prob_home": resultados["p_home"] * 100,
+        "prob_draw": resultados["p_draw"] * 100,
+        "prob_away": resultados["p_away"] * 100,
+    }
+    linhas_gols = dt.mercados_over_under(resultados["matriz"], dt.LINHAS_GOLS_LOTE)
+    for over_under in linhas_gols.itertuples():
+        linha[f"over_{over_under.linha}"] = over_under.p_over
+        linha[f"under_{over_under.linha}"] = over_under.p_under
+    btts = dt.calcular_btts(resultados)
+    linha["btts_sim"] = btts["p_btts_sim"]
+    linha["btts_nao"] = btts["p_btts_nao"]
+
+    ht = dt.prever_gol_ht(home, away, df, num_jogos=num_jogos, scenario=scenario, as_of=as_of)
+    linha["lambda_home_ht"] = ht["lambda_home_ht"]
+    linha["lambda_away_ht"] = ht["lambda_away_ht"]
+    linha["gol_ht"] = ht["p_gol_ht"]
+    linha["jogos_home_considerados"] = resultados["jogos_home_considerados"]
+    linha["jogos_away_considerados"] = resultados["jogos_away_considerados"]
+    return linha
+
+
+def _analisar_bloco(bloco: list) -> list:
+    """Executado no processo filho: analisa um bloco de jogos usando _BASE."""
+    return [analisar_jogo(home, away, _BASE, num_jogos, scenario, as_of)
+            for home, away, num_jogos, scenario, as_of in bloco]
+
+
+def analisar_jogos_do_dia(
+    fixtures_df: pd.DataFrame,
+    df: pd.DataFrame,
+    num_jogos: int = 6,
+    scenario: str = "Casa/Fora",
+    workers: int = None,
+    min_paralelo: int = MIN_JOGOS_PARALELO,
+    as_of=None,
+) -> pd.DataFrame:
+    """
+    Analisa todos os jogos do dia com o pipeline por jogo, distribuindo
+    os jogos entre processos (fork) quando vale a pena.
+    Só para a CLI e o benchmark: dentro do servidor do Streamlit (threads das
+    sessões, prefetch), roda em série em vez de fazer fork.
+    A ordem do resultado é sempre a de fixtures_df, com ou sem paralelismo.
+    """
+    global _BASE
+    workers = workers or os.cpu_count() or 1
+    tarefas = [(home, away, num_jogos, scenario, as_of)
+               for home, away in zip(fixtures_df["home"], fixtures_df["away"])]
+
+    # Índice construído antes do fork para ser herdado pelos workers
+    dt.indice_da_base(df)
+
+    em_serie = (workers <= 1 or len(tarefas) < min_paralelo
+                or "fork" not in multiprocessing.get_all_start_methods()
+                or runtime.exists())
+    if em_serie:
+        linhas = [analisar_jogo(home, away, df, n, sc, data)
+                  for home, away, n, sc, data in tarefas]
+    else:
+        # Blocos pequenos o bastante para balancear a carga entre workers
+        tamanho = math.ceil(len(tarefas) / (workers * 4))
+        blocos = [tarefas[i:i + tamanho] for i in range(0, len(tarefas), tamanho)]
+        with _lock_base:
+            _BASE = df
+            try:
+                contexto = multiprocessing.get_context("fork")
+                with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+                    linhas = [linha for bloco in executor.map(_analisar_bloco, blocos)
+                              for linha in bloco]
+            finally:
+                _BASE = None
+
+    validos = [linha is not None for linha in linhas]
+    resultado = fixtures_df[validos].reset_index(drop=True)
+    mercados = pd.DataFrame([linha for linha in linhas if linha is not None])
+    return pd.concat([resultado, mercados], axis=1)
@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import pandas as pd
+import data as dt
+import metrics as mt
+from config import DIR_CACHE
+
+# Tabela local com as previsões de todos os jogos do dia já calculadas, para
+# o Filtro de Oportunidades virar uma consulta em vez de um novo cálculo.
+ARQUIVO_PREVISOES = os.path.join(DIR_CACHE, "previsoes.sqlite")
+NUM_JOGOS_PREVISOES = (5, 6, 8, 10)
+CENARIOS_PREVISOES = ("Geral", "Casa/Fora")
+# Colunas do arquivo de jogos gravadas na tabela; as demais vêm do lote. Fixas
+# para o esquema não mudar (e a tabela não ser recriada) com o CSV do dia
+COLUNAS_JOGOS = ["hora", "liga", "home", "away"]
+
+_lock_materializacao = threading.Lock()
+# (data, chave) já materializados neste processo: evita ir ao SQLite a cada rerun
+_materializadas = set()
+# (data, chave) agendados no executor do app e ainda não gravados
+_agendadas = set()
+_lock_agendamento = threading.Lock()
+_executor_materializacao = None
+
+
+@contextmanager
+def _conectar():
+    """Conexão com a tabela local; confirma a transação e fecha ao sair."""
+    os.makedirs(DIR_CACHE, exist_ok=True)
+    con = sqlite3.connect(ARQUIVO_PREVISOES, timeout=30)
+    try:
+        with con:
+            yield con
+    finally:
+        con.close()
+
+
+def chave_previsoes(df_proximos: pd.DataFrame, df_jogos: pd.DataFrame) -> str:
+    """
+    Identifica o par (versão da base histórica, lista de jogos do dia): se
+    qualquer um mudar, as previsões gravadas deixam de valer.
+    """
+    versao = dt._hash_base(df_jogos)
+    jogos = int(pd.util.hash_pandas_object(
+        df_proximos[["home", "away"]].astype(str), index=False).sum())
+    return f"{versao}|{jogos:x}"
+
+
+def _tabela_existe(con: sqlite3.Connection) -> bool:
+    return con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'previsoes'").fetchone() is not None
+
+
+def previsoes_materializadas(data_iso: str, chave: str) -> bool:
+    """Se a tabela já tem as previsões do dia para esta chave."""
+    if (data_iso, chave) in _materializadas:
+        return True
+    if not os.path.exists(ARQUIVO_PREVISOES):
+        return False
+    with _conectar() as con:
+        existe = _tabela_existe(con) and con.execute(
+            "SELECT 1 FROM previsoes WHERE data = ? AND chave = ? LIMIT 1",
+            (data_iso, chave)).fetchone() is not None
+    if existe:
+        _materializadas.add((data_iso, chave))
+    return existe
+
+
+@mt.cronometrado()
+def materializar_previsoes(data_iso: str, df_proximos: pd.DataFrame, df_jogos: pd.DataFrame,
+                           forcar: bool = False) -> int:
+    """
+    Calcula todos os mercados de prever_jogos_em_lote para cada jogo do dia em
+    cada combinação de NUM_JOGOS_PREVISOES × CENARIOS_PREVISOES e grava na
+    tabela local, substituindo previsões antigas da mesma data. Só entram os
+    jogos da base anteriores a data_iso (as_of), como no próprio dia.
+    Retorna o número de linhas gravadas (0 se já estava materializado).
+    """
+    if df_proximos.empty or df_jogos.empty:
+        return 0
+    chave = chave_previsoes(df_proximos, df_jogos)
+
+    with _lock_materializacao:
+        if not forcar and previsoes_materializadas(data_iso, chave):
+            return 0
+
+        partes = []
+        for num_jogos in NUM_JOGOS_PREVISOES:
+            for scenario in CENARIOS_PREVISOES:
+                df_lote = dt.prever_jogos_em_lote(
+                    df_proximos, df_jogos, num_jogos=num_jogos, scenario=scenario, as_of=data_iso)
+                mercados = [c for c in df_lote.columns if c not in df_proximos.columns]
+                df_lote = df_lote.reindex(columns=COLUNAS_JOGOS + mercados)
+                df_lote.insert(0, "scenario", scenario)
+                df_lote.insert(0, "num_jogos", num_jogos)
+                partes.append(df_lote)
+        df_previsoes = pd.concat(partes, ignore_index=True)
+        df_previsoes.insert(0, "chave", chave)
+        df_previsoes.insert(0, "data", data_iso)
+
+        with _conectar() as con:
+            if _tabela_existe(con):
+                colunas = [linha[1] for linha in con.execute("PRAGMA table_info(previsoes)")]
+                if colunas != list(df_previsoes.columns):
+                    # Mercados do lote mudaram (nova versão do código): recria
+                    con.execute("DROP TABLE previsoes")
+                else:
+                    con.execute("DELETE FROM previsoes WHERE data = ?", (data_iso,))
+            df_previsoes.to_sql("previsoes", con, if_exists="append", index=False)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_previsoes "
+                        "ON previsoes (data, chave, num_jogos, scenario)")
+        _materializadas.difference_update({m for m in _materializadas if m[0] == data_iso})
+        _materializadas.add((data_iso, chave))
+        return len(df_previsoes)
+
+
+def _agendamento_concluido(marca: tuple, _tarefa):
+    with _lock_agendamento:
+        _agendadas.discard(marca)
+
+
+def materializar_em_segundo_plano(data_iso: str, df_proximos: pd.DataFrame,
+                                  df_jogos: pd.DataFrame) -> bool:
+    """
+    Agenda materializar_previsoes numa thread do processo, fora da execução
+    do script: a página não espera os cálculos e o filtro usa o motor em lote
+    até a tabela ficar pronta. Retorna True se agendou.
+    """
+    global _executor_materializacao
+    if df_proximos.empty or df_jogos.empty:
+        return False
+    marca = (data_iso, chave_previsoes(df_proximos, df_jogos))
+    with _lock_agendamento:
+        if marca in _agendadas or marca in _materializadas:
+            return False
+        if _executor_materializacao is None:
+            _executor_materializacao = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="materializacao")
+        _agendadas.add(marca)
+        tarefa = _executor_materializacao.submit(
+            materializar_previsoes, data_iso, df_proximos.copy(), df_jogos)
+    tarefa.add_done_callback(lambda f: _agendamento_concluido(marca, f))
+    return True
+
+
+@mt.cronometrado()
+def consultar_oportunidades(data_iso: str, chave: str, num_jogos: int, scenario: str,
+                            coluna: str, prob_minima: float):
+    """
+    Jogos materializados com `coluna` >= prob_minima (mesmas colunas de
+    prever_jogos_em_lote, do mais provável ao menos). None quando a data/chave
+    ainda não foi materializada ou a combinação não faz parte da tabela.
+    """
+    if coluna not in dt.MERCADOS_LOTE.values():
+        raise ValueError(f"Mercado desconhecido: {coluna}")
+    if num_jogos not in NUM_JOGOS_PREVISOES or scenario not in CENARIOS_PREVISOES:
+        return None
+    if not previsoes_materializadas(data_iso, chave):
+        return None
+
+    with _conectar() as con:
+        if not _tabela_existe(con):
+            _materializadas.discard((data_iso, chave))
+            return None
+        df = pd.read_sql_query(
+            'SELECT * FROM previsoes WHERE data = ? AND chave = ? AND num_jogos = ? '
+            f'AND scenario = ? AND "{coluna}" >= ? ORDER BY "{coluna}" DESC',
+            con, params=(data_iso, chave, num_jogos, scenario, prob_minima))
+    if df.empty:
+        # Outro processo (ex.: redscore materializar --forcar) pode ter apagado
+        # ou trocado as linhas do dia: confere no SQLite antes de dizer "nenhum jogo"
+        _materializadas.discard((data_iso, chave))
+        if not previsoes_materializadas(data_iso, chave):
+            return None
+    return df.drop(columns=["data", "chave", "num_jogos", "scenario"])
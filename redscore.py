@@ -0,0 +1,134 @@
+"""
+Filtro de Oportunidades sem interface (cron/batch).
+
+Exemplos:
+    python -m redscore scan --date 2026-10-18 --market over_2.5 --min-prob 60 \
+        --output oportunidades.parquet
+    python -m redscore scan --date 2026-10-18 --workers 4
+    python -m redscore materializar --date 2026-10-18
+
+Carrega a base histórica uma vez, roda prever_jogos_em_lote em todos os
+jogos do dia e grava o resultado em CSV, Parquet ou JSON (pela extensão
+do arquivo ou por --format). Sem --output, escreve CSV na saída padrão.
+Com --workers, usa o pipeline por jogo distribuído entre processos
+(parallel.py) em vez do lote; só disponível aqui, fora do app.
+"materializar" grava as previsões do dia na tabela local usada pelo app.
+"""
+import argparse
+import sys
+from datetime import date
+import pandas as pd
+import metrics as mt
+
+# Sem o servidor do Streamlit (antes dos imports que criam as caches)
+mt.silenciar_avisos_streamlit()
+import data as dt
+import parallel as par
+import previsoes as pv
+import services as sv
+
+FORMATOS = ("csv", "parquet", "json")
+CENARIOS = ("Geral", "Casa/Fora")
+
+
+def scan(dia: date, num_jogos: int = 6, scenario: str = "Casa/Fora",
+         mercado: str = None, prob_minima: float = 0, workers: int = None) -> pd.DataFrame:
+    """
+    Todos os mercados dos jogos do dia (colunas de prever_jogos_em_lote),
+    usando só o histórico anterior ao dia.
+    Com `mercado` (ex.: "over_2.5"), mantém só os jogos com prob >= prob_minima.
+    Com `workers`, roda o pipeline por jogo em processos (analisar_jogos_do_dia).
+    """
+    df_jogos = sv.carregar_base_historica()
+    if df_jogos.empty:
+        raise RuntimeError("Base histórica indisponível.")
+
+    df_proximos = sv.carregar_jogos_do_dia(dia.strftime("%Y-%m-%d"))
+    if df_proximos.empty:
+        return df_proximos
+
+    if workers:
+        df_lote = par.analisar_jogos_do_dia(df_proximos, df_jogos, num_jogos=num_jogos,
+                                            scenario=scenario, workers=workers, as_of=dia)
+    else:
+        df_lote = dt.prever_jogos_em_lote(df_proximos, df_jogos, num_jogos=num_jogos,
+                                          scenario=scenario, as_of=dia)
+    if mercado:
+        df_lote = dt.filtrar_oportunidades(df_lote, mercado, prob_minima)
+    return df_lote.reset_index(drop=True)
+
+
+def materializar(dia: date, forcar: bool = False) -> int:
+    """Grava na tabela local as previsões de todos os jogos do dia (ver previsoes.py)."""
+    df_jogos = sv.carregar_base_historica()
+    if df_jogos.empty:
+        raise RuntimeError("Base histórica indisponível.")
+    data_iso = dia.strftime("%Y-%m-%d")
+    return pv.materializar_previsoes(
+        data_iso, sv.carregar_jogos_do_dia(data_iso), df_jogos, forcar=forcar)
+
+
+def salvar(df: pd.DataFrame, destino: str = None, formato: str = None):
+    """Grava df no formato pedido (ou deduzido da extensão de destino)."""
+    if formato is None:
+        formato = destino.rsplit(".", 1)[-1].lower() if destino and "." in destino else "csv"
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato não suportado: {formato} (use {', '.join(FORMATOS)})")
+
+    if formato == "parquet":
+        if destino is None:
+            raise ValueError("Parquet precisa de --output.")
+        df.to_parquet(destino, index=False)
+    elif formato == "json":
+        df.to_json(destino or sys.stdout, orient="records", force_ascii=False, indent=2)
+    else:
+        df.to_csv(destino or sys.stdout, index=False)
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(prog="redscore", description=__doc__.split("\n\n")[0].strip())
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    p_scan = comandos.add_parser("scan", help="Analisa todos os jogos do dia.")
+    p_scan.add_argument("--date", type=date.fromisoformat, default=date.today(),
+                        help="Data dos jogos (AAAA-MM-DD). Padrão: hoje.")
+    p_scan.add_argument("--market", choices=sorted(dt.MERCADOS_LOTE.values()),
+                        help="Mercado a filtrar (coluna de prever_jogos_em_lote).")
+    p_scan.add_argument("--min-prob", type=float, default=0,
+                        help="Probabilidade mínima (%%) no mercado escolhido.")
+    p_scan.add_argument("--num-jogos", type=int, default=6,
+                        help="Últimos N jogos de cada time. Padrão: 6.")
+    p_scan.add_argument("--scenario", choices=CENARIOS, default="Casa/Fora")
+    p_scan.add_argument("--workers", type=int,
+                        help="Roda o pipeline por jogo em N processos em vez do lote.")
+    p_scan.add_argument("--output", help="Arquivo de saída (.csv, .parquet ou .json).")
+    p_scan.add_argument("--format", choices=FORMATOS, help="Força o formato de saída.")
+
+    p_mat = comandos.add_parser("materializar", help="Pré-calcula as previsões do dia para o app.")
+    p_mat.add_argument("--date", type=date.fromisoformat, default=date.today(),
+                       help="Data dos jogos (AAAA-MM-DD). Padrão: hoje.")
+    p_mat.add_argument("--forcar", action="store_true",
+                       help="Recalcula mesmo que a data já esteja materializada.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _argumentos(argv)
+    try:
+        if args.comando == "materializar":
+            linhas = materializar(args.date, forcar=args.forcar)
+            print(f"{linhas} previsão(ões) gravada(s) para {args.date}", file=sys.stderr)
+            return 0
+        df = scan(args.date, num_jogos=args.num_jogos, scenario=args.scenario,
+                  mercado=args.market, prob_minima=args.min_prob, workers=args.workers)
+        salvar(df, args.output, args.format)
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    if args.output:
+        print(f"{len(df)} jogo(s) gravado(s) em {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,72 +1,624 @@
+import glob
+import io
+import json
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
 import requests
-from datetime import date
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 import streamlit as st
-from config import URL_DADOS, URL_BASE_JOGOS
+import data as dt
+import metrics as mt
+from config import (URL_DADOS, URL_BASE_JOGOS, DIR_CACHE, INTERVALO_VERIFICACAO_BASE,
+                    INTERVALO_VERIFICACAO_JOGOS, TIMEOUT_HTTP, JANELA_PREFETCH_JOGOS,
+                    TTL_JOGOS_AUSENTES, WORKERS_PREFETCH_JOGOS, MAX_PARTES_BASE)
+
+# ✅ Colunas essenciais da base histórica
+COLUNAS_ESSENCIAIS = [
+    "Home", "Away", "Data",
+    "H_Gols_FT", "A_Gols_FT",
+    "H_Gols_HT", "A_Gols_HT",
+    "H_Escanteios", "A_Escanteios",
+    "H_Chute", "A_Chute",
+    "H_Ataques", "A_Ataques"
+]
+
+# Tipos compactos da base histórica. Inteiros que não cabem no tipo são
+# promovidos (int8 → int16 → int32); colunas com valores faltando viram float32.
+TIPO_DATA = pd.ArrowDtype(pa.date32())
+ESQUEMA_NUMERICO = {
+    "H_Gols_FT": "int8", "A_Gols_FT": "int8",
+    "H_Gols_HT": "int8", "A_Gols_HT": "int8",
+    "H_Escanteios": "int8", "A_Escanteios": "int8",
+    "H_Chute": "int8", "A_Chute": "int8",
+    "H_Ataques": "int16", "A_Ataques": "int16",
+}
+
+ARQUIVO_BASE = os.path.join(DIR_CACHE, "dados_redscore.feather")
+ARQUIVO_METADADOS = os.path.join(DIR_CACHE, "dados_redscore.json")
+# Dias anexados pela sincronização, até a próxima compactação
+PADRAO_PARTES = "dados_redscore.parte-*.feather"
+
+
+_sessao_http = None
+_lock_sessao = threading.Lock()
+
+
+def sessao_http() -> requests.Session:
+    """Sessão HTTP compartilhada (keep-alive e pool de conexões com o GitHub)."""
+    global _sessao_http
+    with _lock_sessao:
+        if _sessao_http is None:
+            sessao = requests.Session()
+            sessao.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=2))
+            sessao.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=2))
+            _sessao_http = sessao
+        return _sessao_http
+
+
+# Cache local dos arquivos de jogos do dia, por URL:
+#   {"etag", "last_modified", "conteudo", "verificado_em"}  arquivo baixado
+#   {"ausente_em"}                                          404 (cache negativo)
+_cache_jogos = {}
+_downloads_jogos = {}   # URL -> Future do download em andamento (prefetch)
+_lock_jogos = threading.RLock()
+_executor_prefetch = None
+
+
+def _url_jogos(data_iso: str) -> str:
+    return f"{URL_BASE_JOGOS}/Jogos_do_Dia_RedScore_{data_iso}.csv"
+
+
+def _entrada_valida(entrada: dict, agora: float) -> bool:
+    """Entrada do cache que ainda dispensa ir à rede."""
+    if entrada is None:
+        return False
+    if "ausente_em" in entrada:
+        return agora - entrada["ausente_em"] < TTL_JOGOS_AUSENTES
+    return agora - entrada["verificado_em"] < INTERVALO_VERIFICACAO_JOGOS
+
+
+def _baixar_jogos_do_dia(url: str):
+    """
+    GET condicional do arquivo de jogos do dia. Retorna o corpo (bytes) ou
+    None quando o arquivo não existe (ainda) no repositório; qualquer outro
+    status levanta requests.HTTPError.
+    """
+    with _lock_jogos:
+        anterior = _cache_jogos.get(url)
+    headers = {}
+    if anterior and "conteudo" in anterior:
+        if anterior["etag"]:
+            headers["If-None-Match"] = anterior["etag"]
+        if anterior["last_modified"]:
+            headers["If-Modified-Since"] = anterior["last_modified"]
+    else:
+        anterior = None
+
+    with mt.medir("download jogos do dia"):
+        response = sessao_http().get(url, headers=headers, timeout=TIMEOUT_HTTP)
+    agora = time.time()
+    if response.status_code == 304 and anterior:
+        entrada = {**anterior, "verificado_em": agora}
+    elif response.status_code == 404:
+        entrada = {"ausente_em": agora}
+    elif response.status_code != 200:
+        # Outros erros (ex.: rate limit, 5xx) sobem para quem chamou e não entram no cache
+        raise requests.HTTPError(f"HTTP {response.status_code} ao baixar {url}", response=response)
+    else:
+        entrada = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "conteudo": response.content,
+            "verificado_em": agora,
+        }
+    with _lock_jogos:
+        _cache_jogos[url] = entrada
+    return entrada.get("conteudo")
+
+
+def _conteudo_jogos(url: str):
+    """
+    Corpo do arquivo de jogos do dia: do cache local quando ainda válido,
+    do download em andamento no prefetch, ou de um novo GET condicional.
+    """
+    with _lock_jogos:
+        entrada = _cache_jogos.get(url)
+        if _entrada_valida(entrada, time.time()):
+            return entrada.get("conteudo")
+        download = _downloads_jogos.get(url)
+    if download is not None:
+        try:
+            return download.result()
+        except requests.RequestException:
+            pass
+    return _baixar_jogos_do_dia(url)
+
+
+def _prefetch_concluido(url: str, _future):
+    with _lock_jogos:
+        _downloads_jogos.pop(url, None)
+
+
+def prefetch_jogos(dia: date, dias_antes: int = None, dias_depois: int = None) -> int:
+    """
+    Aquece em segundo plano o cache dos jogos do dia para as datas em volta
+    de `dia` (padrão: JANELA_PREFETCH_JOGOS), usando um pool de threads.
+    Datas já em cache ou em download são ignoradas. Retorna quantas foram agendadas.
+    """
+    global _executor_prefetch
+    padrao_antes, padrao_depois = JANELA_PREFETCH_JOGOS
+    dias_antes = padrao_antes if dias_antes is None else dias_antes
+    dias_depois = padrao_depois if dias_depois is None else dias_depois
+
+    agendados = 0
+    agora = time.time()
+    with _lock_jogos:
+        if _executor_prefetch is None:
+            _executor_prefetch = ThreadPoolExecutor(
+                max_workers=WORKERS_PREFETCH_JOGOS, thread_name_prefix="prefetch_jogos")
+        for delta in range(-dias_antes, dias_depois + 1):
+            url = _url_jogos((dia + timedelta(days=delta)).strftime("%Y-%m-%d"))
+            if url in _downloads_jogos or _entrada_valida(_cache_jogos.get(url), agora):
+                continue
+            download = _executor_prefetch.submit(_baixar_jogos_do_dia, url)
+            _downloads_jogos[url] = download
+            download.add_done_callback(lambda f, url=url: _prefetch_concluido(url, f))
+            agendados += 1
+    return agendados
+
+
+@mt.cronometrado("leitura CSV jogos do dia")
+def _ler_jogos_do_dia(conteudo: bytes) -> pd.DataFrame:
+    """Lê o CSV de jogos do dia já baixado, mantendo só linhas com hora HH:MM."""
+    df_futuros = pd.read_csv(io.BytesIO(conteudo), dtype={"hora": str})
+    condicao_hora_valida = df_futuros['hora'].str.match(r'^\d{2}:\d{2}$', na=False)
+    df_futuros = df_futuros[condicao_hora_valida].copy()
+    df_futuros['confronto'] = df_futuros['home'] + \
+        ' x ' + df_futuros['away']
+    return df_futuros
+
+
+def carregar_jogos_do_dia(data_iso: str) -> pd.DataFrame:
+    """
+    Jogos do dia (data no formato AAAA-MM-DD) com no máximo uma requisição
+    (nenhuma se a data já estiver no cache local, ex.: pelo prefetch).
+    DataFrame vazio quando não há arquivo para a data.
+    """
+    conteudo = _conteudo_jogos(_url_jogos(data_iso))
+    if conteudo is None:
+        return pd.DataFrame()
+    return _ler_jogos_do_dia(conteudo)
 
 
-@st.cache_data
 def carregar_dados(data_escolhida: date):
-    """Carrega dados históricos e jogos do dia com base na data escolhida (date)."""
+    """
+    Carrega os jogos do dia com base na data escolhida (date). Sem
+    st.cache_data: o cache local (_cache_jogos) já respeita os TTLs do
+    arquivo baixado e do 404.
+    """
     data_br = data_escolhida.strftime("%d/%m/%Y")   # exibição
     data_iso = data_escolhida.strftime("%Y-%m-%d")  # nome do arquivo
 
-    # Carrega base histórica
-    df_historicos = pd.read_csv(URL_DADOS)
-
-    # Monta URL dos jogos do dia
-    url_jogos = f"{URL_BASE_JOGOS}/Jogos_do_Dia_RedScore_{data_iso}.csv"
     df_futuros = pd.DataFrame()
-
     try:
-        response = requests.get(url_jogos)
-        if response.status_code == 200:
-            df_futuros = pd.read_csv(url_jogos)
-            condicao_hora_valida = df_futuros['hora'].astype(
-                str).str.match(r'^\d{2}:\d{2}$')
-            df_futuros = df_futuros[condicao_hora_valida].copy()
-            df_futuros['confronto'] = df_futuros['home'] + \
-                ' x ' + df_futuros['away']
+        df_futuros = carregar_jogos_do_dia(data_iso)
     except Exception as e:
         st.warning(f"Erro ao carregar jogos de {data_br}: {e}")
 
-    return df_historicos, df_futuros, data_br, data_iso
+    return df_futuros, data_br, data_iso
+
+
+def _ler_metadados() -> dict:
+    """Lê os metadados do cache local (ETag, Last-Modified, linhas, partes...)."""
+    if not os.path.exists(ARQUIVO_METADADOS) or not os.path.exists(ARQUIVO_BASE):
+        return {}
+    with open(ARQUIVO_METADADOS, encoding="utf-8") as f:
+        meta = json.load(f)
+    # Parte faltando: o cache local está incompleto, baixa tudo de novo
+    if not all(os.path.exists(_arquivo_parte(p)) for p in meta.get("partes", [])):
+        return {}
+    return meta
+
+
+def _salvar_metadados(meta: dict):
+    tmp = ARQUIVO_METADADOS + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, ARQUIVO_METADADOS)
+
+
+def _codificar_times(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normaliza os nomes dos times (espaços) e grava Home/Away como categorias
+    com o mesmo dicionário, para que os filtros comparem códigos inteiros.
+    """
+    home = df["Home"].astype(str).str.split().str.join(" ")
+    away = df["Away"].astype(str).str.split().str.join(" ")
+    times = pd.Index(pd.unique(pd.concat([home, away], ignore_index=True))).sort_values()
+    df["Home"] = pd.Categorical(home, categories=times)
+    df["Away"] = pd.Categorical(away, categories=times)
+    return df
+
+
+def _inteiro_compacto(serie: pd.Series, tipo: str) -> pd.Series:
+    """Converte para `tipo` (ou o menor inteiro maior que comporte os valores)."""
+    serie = pd.to_numeric(serie, errors="coerce")
+    if serie.isna().any():
+        return serie.astype("float32")
+    for candidato in ("int8", "int16", "int32", "int64"):
+        if np.dtype(candidato).itemsize < np.dtype(tipo).itemsize:
+            continue
+        limites = np.iinfo(candidato)
+        if serie.empty or (serie.min() >= limites.min and serie.max() <= limites.max):
+            return serie.astype(candidato)
+    return serie
+
+
+def _aplicar_esquema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tipos compactos: data como date32 (Arrow), times com dicionário comum,
+    demais textos (liga, país) como category e estatísticas como int8/int16.
+    """
+    if df["Data"].dtype != TIPO_DATA:
+        df["Data"] = pd.array(pa.array(df["Data"], type=pa.date32()), dtype=TIPO_DATA)
+    df = _codificar_times(df)
+    for col, tipo in ESQUEMA_NUMERICO.items():
+        if col in df.columns:
+            df[col] = _inteiro_compacto(df[col], tipo)
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+@mt.cronometrado("tipagem da base")
+def _tipar_base(df: pd.DataFrame) -> pd.DataFrame:
+    """Valida datas, converte tipos e ordena a base por data (mais antiga primeiro)."""
+    df['Data'] = pd.to_datetime(
+        df['Data'], format="%Y-%m-%d", errors="coerce")
+    jogos_com_data_invalida = df['Data'].isnull().sum()
+
+    if jogos_com_data_invalida > 0:
+        st.warning(
+            f"{jogos_com_data_invalida} jogo(s) foram ignorados por erro na data."
+        )
+        df.dropna(subset=['Data'], inplace=True)
+
+    df['Data'] = df['Data'].dt.date
+    df = _aplicar_esquema(df)
+
+    # Ordenação estável: mantém a ordem de inserção dentro do mesmo dia
+    return df.sort_values(by="Data", kind="stable").reset_index(drop=True)
+
+
+def _salvar_base(df: pd.DataFrame, destino: str = ARQUIVO_BASE):
+    """
+    Grava a base em Feather sem compressão e num único bloco por coluna:
+    assim a leitura via memory-map não precisa copiar (concatenar) nada.
+    """
+    os.makedirs(DIR_CACHE, exist_ok=True)
+    tmp = destino + ".tmp"
+    tabela = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    feather.write_feather(tabela, tmp, compression="uncompressed")
+    os.replace(tmp, destino)
+
+
+def _arquivo_parte(parte: dict) -> str:
+    return os.path.join(DIR_CACHE, parte["arquivo"])
+
+
+def _juntar(partes: list) -> pd.DataFrame:
+    """Concatena pedaços da base, reaplica o esquema e ordena por data."""
+    nao_vazias = [p for p in partes if not p.empty] or partes[:1]
+    # Categorias diferentes entre as partes viram object no concat: reaplica o esquema
+    df = _aplicar_esquema(pd.concat(nao_vazias, ignore_index=True))
+    return df.sort_values(by="Data", kind="stable").reset_index(drop=True)
+
+
+def _remover_partes(partes: list = None):
+    """Apaga os arquivos de parte dados (padrão: todos os do cache local)."""
+    if partes is None:
+        arquivos = glob.glob(os.path.join(DIR_CACHE, PADRAO_PARTES))
+    else:
+        arquivos = [_arquivo_parte(p) for p in partes]
+    for arquivo in arquivos:
+        try:
+            os.remove(arquivo)
+        except FileNotFoundError:
+            pass
+
+
+def _fatia(caminho: str, desde: str = None, ate: str = None) -> pa.Table:
+    """Jogos de um Feather da base (memory-map) com data em [desde, ate)."""
+    tabela = feather.read_table(caminho, memory_map=True)
+    datas = tabela["Data"].to_numpy()
+    inicio = 0 if desde is None else np.searchsorted(datas, np.datetime64(desde, "D"))
+    fim = len(datas) if ate is None else np.searchsorted(datas, np.datetime64(ate, "D"))
+    return tabela.slice(inicio, max(fim - inicio, 0))
+
+
+def _fatias_base(partes: list, desde: str = None) -> list:
+    """
+    Jogos válidos de cada arquivo da base (principal e partes), a partir de
+    `desde`: cada arquivo vale até o início da parte seguinte, que o encobre.
+    """
+    arquivos = [ARQUIVO_BASE] + [_arquivo_parte(p) for p in partes]
+    limites = [p["inicio"] for p in partes] + [None]
+    return [_fatia(arquivo, desde, ate).to_pandas(types_mapper={pa.date32(): TIPO_DATA}.get)
+            for arquivo, ate in zip(arquivos, limites)]
+
+
+def _ler_base_compartilhada(partes: list = ()) -> pd.DataFrame:
+    """
+    Lê a base do Feather via memory-map. Com split_blocks, as colunas
+    numéricas e os códigos das categorias apontam direto para o arquivo
+    mapeado (somente leitura): sessões e processos compartilham as mesmas
+    páginas em vez de cada um ter sua cópia.
+    Com partes anexadas ainda não compactadas, a base é montada em memória
+    (uma cópia por versão) até a próxima compactação.
+    """
+    if partes:
+        return _juntar(_fatias_base(partes))
+    tabela = feather.read_table(ARQUIVO_BASE, memory_map=True)
+    return tabela.to_pandas(split_blocks=True, types_mapper={pa.date32(): TIPO_DATA}.get)
+
+
+def _ancora(conteudo: bytes) -> bytes:
+    """Última linha completa do CSV (com a quebra de linha final)."""
+    inicio = conteudo.rstrip(b"\r\n").rfind(b"\n") + 1
+    return conteudo[inicio:]
+
+
+def _somas_para_json(somas: pd.DataFrame) -> list:
+    return somas.reset_index(names="liga").to_dict(orient="records")
+
+
+def _somas_de_json(registros: list):
+    if not registros:
+        return None
+    return pd.DataFrame.from_records(registros).set_index("liga")
+
+
+def _anexar_novos_jogos(df_novos: pd.DataFrame, somas: pd.DataFrame, partes: list, linhas: int):
+    """
+    Anexa jogos novos ao cache local com deduplicação em (Data, Home, Away).
+    Os jogos novos vão para um arquivo de parte que começa na data do mais
+    antigo deles e encobre o que os arquivos anteriores têm a partir dessa
+    data: só esses jogos (em geral, um dia) são lidos e regravados, e as
+    somas das médias da liga são atualizadas só com essa janela. O arquivo
+    principal só é reescrito na compactação, acima de MAX_PARTES_BASE partes.
+    Retorna (total de linhas, somas atualizadas, partes).
+    """
+    if somas is None:
+        somas = dt.somas_estatisticas(_ler_base_compartilhada(partes))
+    if df_novos.empty:
+        return linhas, somas, partes
+
+    data_inicio = str(df_novos["Data"].min())
+    removidos = _juntar(_fatias_base(partes, data_inicio))
+    janela = pd.concat([r for r in (removidos, df_novos) if not r.empty], ignore_index=True)
+    janela = _juntar([janela.drop_duplicates(subset=["Data", "Home", "Away"], keep="last")])
+    somas = dt.atualizar_somas_estatisticas(somas, janela, removidos=removidos)
+
+    nova = {"arquivo": PADRAO_PARTES.replace("*", str(time.time_ns())), "inicio": data_inicio}
+    _salvar_base(janela, _arquivo_parte(nova))
+    # Partes que começam na janela ficam inteiramente encobertas pela nova
+    _remover_partes([p for p in partes if p["inicio"] >= data_inicio])
+    partes = [p for p in partes if p["inicio"] < data_inicio] + [nova]
+    linhas = linhas - len(removidos) + len(janela)
+    if len(partes) > MAX_PARTES_BASE:
+        partes = _compactar_base(partes)
+    return linhas, somas, partes
+
+
+def _compactar_base(partes: list) -> list:
+    """Junta arquivo principal e partes num único Feather e apaga as partes. Retorna []."""
+    _salvar_base(_ler_base_compartilhada(partes))
+    _remover_partes(partes)
+    return []
+
+
+def _ingerir_base_completa(response: requests.Response) -> dict:
+    """Substitui o cache local pelo arquivo completo recebido."""
+    conteudo = response.content
+    with mt.medir("leitura CSV base"):
+        df = pd.read_csv(io.BytesIO(conteudo))
+    df = _tipar_base(df)
+    _salvar_base(df)
+    _remover_partes()
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "linhas": len(df),
+        "ultima_data": str(df["Data"].max()) if not df.empty else None,
+        "bytes": len(conteudo),
+        "cabecalho": conteudo[:conteudo.find(b"\n") + 1].decode("utf-8"),
+        "ancora": _ancora(conteudo).decode("utf-8"),
+        "somas": _somas_para_json(dt.somas_estatisticas(df)),
+        "partes": [],
+    }
+
+
+def _baixar_novos_jogos(meta: dict, headers: dict):
+    """
+    Busca só o final do arquivo via HTTP Range, a partir da última linha já
+    ingerida (âncora). Retorna os metadados atualizados ou None quando o
+    arquivo foi reescrito e é preciso baixar tudo de novo.
+    """
+    ancora = meta["ancora"].encode("utf-8")
+    inicio = meta["bytes"] - len(ancora)
+    with mt.medir("download base (cauda)"):
+        response = sessao_http().get(
+            URL_DADOS, timeout=TIMEOUT_HTTP,
+            headers={**headers, "Range": f"bytes={inicio}-", "Accept-Encoding": "identity"})
+
+    if response.status_code == 304:
+        return meta
+    if response.status_code == 200:
+        # Servidor ignorou o Range e mandou o arquivo inteiro
+        return _ingerir_base_completa(response)
+    if response.status_code != 206:
+        # 416: o arquivo encolheu, logo foi reescrito
+        return None
+
+    conteudo = response.content
+    if not conteudo.startswith(ancora):
+        return None
+
+    cauda = conteudo[len(ancora):]
+    if cauda.strip():
+        df_novos = _tipar_base(pd.read_csv(
+            io.BytesIO(meta["cabecalho"].encode("utf-8") + cauda)))
+        meta["linhas"], somas, meta["partes"] = _anexar_novos_jogos(
+            df_novos, _somas_de_json(meta.get("somas")), meta.get("partes", []), meta["linhas"])
+        meta["somas"] = _somas_para_json(somas)
+        if not df_novos.empty:
+            meta["ultima_data"] = max(meta.get("ultima_data") or "", str(df_novos["Data"].max()))
+        meta["ancora"] = _ancora(conteudo).decode("utf-8")
+
+    meta["bytes"] = inicio + len(conteudo)
+    meta["etag"] = response.headers.get("ETag", meta.get("etag"))
+    meta["last_modified"] = response.headers.get("Last-Modified", meta.get("last_modified"))
+    return meta
+
+
+_lock_sincronizacao = threading.Lock()
+
+
+@mt.cronometrado("sincronização da base")
+def _sincronizar_base(forcar: bool = False, esperar: bool = True) -> dict:
+    """
+    Garante que o cache local está atualizado com o upstream.
+    Faz no máximo um GET condicional (ETag/Last-Modified) a cada
+    INTERVALO_VERIFICACAO_BASE segundos; 304 mantém o arquivo local.
+    Como o scraper só acrescenta dias novos ao CSV, a atualização baixa
+    apenas a cauda do arquivo e anexa os jogos novos.
+    Com esperar=False, se outra thread já está sincronizando, devolve os
+    metadados atuais sem esperar o download (só espera sem cópia local).
+    """
+    if not _lock_sincronizacao.acquire(blocking=esperar):
+        meta = _ler_metadados()
+        if meta:
+            return meta
+        _lock_sincronizacao.acquire()
+    try:
+        meta = _ler_metadados()
+        agora = time.time()
+        if not forcar and meta and agora - meta.get("verificado_em", 0) < INTERVALO_VERIFICACAO_BASE:
+            return meta
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            novo_meta = None
+            if meta.get("ancora") and meta.get("bytes"):
+                novo_meta = _baixar_novos_jogos(dict(meta), headers)
+            if novo_meta is None:
+                with mt.medir("download base (completa)"):
+                    response = sessao_http().get(URL_DADOS, timeout=TIMEOUT_HTTP)
+                response.raise_for_status()
+                novo_meta = _ingerir_base_completa(response)
+        except requests.RequestException as e:
+            if not meta:
+                raise
+            st.warning(f"Não foi possível verificar a base no GitHub, usando cópia local: {e}")
+            return meta
+
+        novo_meta["verificado_em"] = agora
+        _salvar_metadados(novo_meta)
+        return novo_meta
+    finally:
+        _lock_sincronizacao.release()
+
+
+def _versao(meta: dict) -> str:
+    """Token curto que identifica o conteúdo da base carregada."""
+    chave = meta.get("etag") or meta.get("last_modified") or ""
+    return f"{chave}:{meta.get('linhas', 0)}"
+
+
+class BaseCompartilhada:
+    """
+    Base histórica do processo, compartilhada por todas as sessões.
+    O par (versão, DataFrame) é trocado numa única atribuição: quem já leu
+    a versão anterior continua com ela, sem travar, até a próxima execução.
+    """
+
+    def __init__(self):
+        self.atual = (None, None)
+        self.lock_recarga = threading.Lock()
+
+    def publicar(self, versao: str, df: pd.DataFrame):
+        _, anterior = self.atual
+        self.atual = (versao, df)
+        # Somas acumuladas da versão anterior não esperam o coletor de lixo
+        if anterior is not None and anterior is not df:
+            dt.descartar_indice(anterior)
+
+
+@st.cache_resource
+def base_do_processo() -> BaseCompartilhada:
+    return BaseCompartilhada()
+
+
+def _abrir_versao(meta: dict) -> pd.DataFrame:
+    """
+    Abre o Feather local (memory-map), valida e indexa a versão descrita em
+    meta. Retorna None se faltarem colunas essenciais.
+    """
+    with mt.medir("leitura Feather base"):
+        df = _ler_base_compartilhada(meta.get("partes", []))
+
+    faltando = [c for c in COLUNAS_ESSENCIAIS if c not in df.columns]
+    if faltando:
+        st.error(f"⚠️ Colunas ausentes no dataset: {faltando}")
+        return None
+
+    dt.versionar_base(df, _versao(meta))
+    # Índice de times e médias da liga construídos uma vez por versão da base
+    dt.indice_da_base(df, somas=_somas_de_json(meta.get("somas")))
+    return df
 
 
 def carregar_base_historica() -> pd.DataFrame:
-    """Carrega e valida a base histórica principal."""
+    """
+    Base histórica validada (somente leitura), a mesma para todas as sessões.
+    Só é reaberta quando a sincronização traz uma versão nova.
+    """
     try:
-        df = pd.read_csv(URL_DADOS)
-
-        df['Data'] = pd.to_datetime(
-            df['Data'], format="%Y-%m-%d", errors="coerce")
-        jogos_com_data_invalida = df['Data'].isnull().sum()
-
-        if jogos_com_data_invalida > 0:
-            st.warning(
-                f"{jogos_com_data_invalida} jogo(s) foram ignorados por erro na data."
-            )
-            df.dropna(subset=['Data'], inplace=True)
-
-        df['Data'] = df['Data'].dt.date
-        df = df.sort_values(by="Data", ascending=False).reset_index(drop=True)
-
-        # ✅ Validação de colunas essenciais
-        colunas_essenciais = [
-            "Home", "Away", "Data",
-            "H_Gols_FT", "A_Gols_FT",
-            "H_Gols_HT", "A_Gols_HT",
-            "H_Escanteios", "A_Escanteios",
-            "H_Chute", "A_Chute",
-            "H_Ataques", "A_Ataques"
-        ]
-
-        faltando = [c for c in colunas_essenciais if c not in df.columns]
-        if faltando:
-            st.error(f"⚠️ Colunas ausentes no dataset: {faltando}")
-            return pd.DataFrame(columns=colunas_essenciais)
-
-        return df
+        compartilhada = base_do_processo()
+        # Com uma versão já publicada, não espera a sincronização de outra sessão
+        meta = _sincronizar_base(esperar=compartilhada.atual[1] is None)
+        versao = _versao(meta)
+
+        versao_atual, df = compartilhada.atual
+        if versao_atual == versao:
+            return df
+        # Uma sessão recarrega; as outras seguem com a versão anterior sem
+        # esperar (só a primeira carga, sem versão anterior, precisa aguardar)
+        if not compartilhada.lock_recarga.acquire(blocking=df is None):
+            return df
+        try:
+            versao_atual, df = compartilhada.atual
+            if versao_atual != versao:
+                df = _abrir_versao(meta)
+                if df is None:
+                    return pd.DataFrame(columns=COLUNAS_ESSENCIAIS)
+                compartilhada.publicar(versao, df)
+            return df
+        finally:
+            compartilhada.lock_recarga.release()
 
     except Exception as e:
         st.error(f"Erro ao carregar a base histórica: {e}")
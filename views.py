@@ -222,3 +222,63 @@ def card_resultado_filtro(index, row_data):
                     "confronto": row_data['Confronto']
                 }
                 st.rerun()
+
+
+# ----------------------------
+# RELATÓRIO DE TEMPOS (instrumentação)
+# ----------------------------
+def mostrar_relatorio_tempos(relatorio: pd.DataFrame, caches: pd.DataFrame, caches_total: pd.DataFrame):
+    """Tempos por etapa desta execução e acertos das funções com cache."""
+    with st.expander("⏱️ Tempos desta execução", expanded=True):
+        st.dataframe(relatorio, hide_index=True, use_container_width=True)
+        st.markdown("**Cache (st.cache_data) nesta execução**")
+        st.dataframe(caches, hide_index=True, use_container_width=True)
+        st.markdown("**Cache desde o início do processo**")
+        st.dataframe(caches_total, hide_index=True, use_container_width=True)
+
+
+# ----------------------------
+# SENSIBILIDADE (janelas × cenários)
+# ----------------------------
+def _rotulo_mercado(coluna: str) -> str:
+    """Rótulo exibido de uma coluna de probabilidade da grade de sensibilidade."""
+    rotulos = {v: k.replace(" (%)", "") for k, v in dt.MERCADOS_LOTE.items()}
+    if coluna in rotulos:
+        return rotulos[coluna]
+    lado, *resto = coluna.split("_")
+    if resto[0] == "cantos":
+        return f"{lado.capitalize()} {resto[1]} Escanteios"
+    return f"{lado.capitalize()} {resto[0]}"
+
+
+def mostrar_sensibilidade(grade: pd.DataFrame, estabilidade: pd.DataFrame,
+                          num_jogos: int, scenario: str):
+    """
+    Probabilidade de cada mercado por janela (uma aba por cenário), com a
+    amplitude e o desvio entre as janelas. A janela e o cenário em uso ficam
+    marcados.
+    """
+    with st.expander("🎚️ Sensibilidade por Janela e Cenário"):
+        if grade.empty:
+            st.info("Sem histórico suficiente para comparar as janelas.")
+            return
+        cenarios = list(dict.fromkeys(grade["scenario"]))
+        abas = st.tabs([f"{c} ✓" if c == scenario else c for c in cenarios])
+        for aba, cenario in zip(abas, cenarios):
+            grade_cenario = grade[grade["scenario"] == cenario].set_index("num_jogos")
+            mercados = [c for c in dt.MERCADOS_SENSIBILIDADE if c in grade_cenario.columns]
+            tabela = grade_cenario[mercados].T
+            tabela.columns = [f"{n} jogos ✓" if n == num_jogos and cenario == scenario else f"{n} jogos"
+                              for n in tabela.columns]
+            variacao = (estabilidade[estabilidade["scenario"] == cenario]
+                        .set_index("mercado")[["amplitude", "desvio"]])
+            tabela = tabela.join(variacao.rename(columns={"amplitude": "Amplitude (p.p.)",
+                                                          "desvio": "Desvio"}))
+            tabela.index = [_rotulo_mercado(c) for c in tabela.index]
+            with aba:
+                st.dataframe(tabela.rename_axis("Mercado").reset_index().round(2),
+                             hide_index=True, use_container_width=True)
+                instaveis = variacao[variacao["amplitude"] >= 10].index
+                if len(instaveis):
+                    st.caption("Mercados que variam 10 p.p. ou mais entre as janelas: "
+                               + ", ".join(_rotulo_mercado(c) for c in instaveis))